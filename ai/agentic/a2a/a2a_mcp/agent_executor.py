@@ -1,10 +1,21 @@
+import json
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events import EventQueue
-from a2a.utils import new_agent_text_message
+from a2a.server.tasks import TaskUpdater
+from a2a.types import Part, TextPart
+from a2a.utils import new_agent_text_message, new_task
 
 
 class SimpleAgentExecutor(AgentExecutor):
-    """Simple Agent Executor for text input/output agents."""
+    """
+    Simple Agent Executor for text input/output agents.
+
+    The request runs as an A2A task: the progress of the agent (its tool
+    calls and intermediate text) is published as working status updates and
+    the tool results as chunks of a `tool_results` artifact while the agent
+    runs, and the final answer as a `response` artifact when the task is
+    completed. Streaming clients receive these events as they happen.
+    """
 
     def __init__(self, agent):
         self.agent = agent
@@ -17,17 +28,54 @@ class SimpleAgentExecutor(AgentExecutor):
         user_text = context.get_user_input()
         print(f"Received user input: {user_text}")
 
-        # Invoke the agent with the user input
-        result = await self.agent.invoke(user_text)
+        task = context.current_task
+        if task is None:
+            task = new_task(context.message)
+            await event_queue.enqueue_event(task)
+        updater = TaskUpdater(event_queue, task.id, task.context_id)
 
-        # Enqueue the result as a message
-        await event_queue.enqueue_event(
-            new_agent_text_message(
-                result,
-                context_id=context.context_id,
-                task_id=context.task_id,
+        def message(text):
+            return new_agent_text_message(
+                text, context_id=task.context_id, task_id=task.id
             )
-        )
+
+        await updater.start_work(message("Processing the request..."))
+
+        # Stream the agent's events as task updates
+        tool_results_id = None
+        async for event in self.agent.stream(user_text):
+            if event["type"] == "text":
+                await updater.start_work(message(event["text"]))
+            elif event["type"] == "tool_call":
+                await updater.start_work(
+                    message(
+                        f"Calling {event['name']}"
+                        f"({json.dumps(event['input'])})"
+                    )
+                )
+            elif event["type"] == "tool_result":
+                parts = [
+                    Part(
+                        root=TextPart(text=f"{event['name']}: {event['text']}")
+                    )
+                ]
+                # The first result starts the artifact, and the next ones are
+                # appended to it
+                append = tool_results_id is not None
+                tool_results_id = f"{task.id}-tool-results"
+                await updater.add_artifact(
+                    parts,
+                    artifact_id=tool_results_id,
+                    name="tool_results",
+                    append=append,
+                )
+            elif event["type"] == "response":
+                await updater.add_artifact(
+                    [Part(root=TextPart(text=event["text"]))], name="response"
+                )
+                await updater.complete(message(event["text"]))
+            elif event["type"] == "error":
+                await updater.failed(message(event["text"]))
 
     async def cancel(
         self, context: RequestContext, event_queue: EventQueue
@@ -1,12 +1,15 @@
 import json
 import argparse
+import contextlib
 import uvicorn
 from a2a.server.apps import A2AStarletteApplication
 from a2a.server.request_handlers import DefaultRequestHandler
 from a2a.server.tasks import InMemoryTaskStore
 from a2a.types import AgentCard
+from starlette.middleware import Middleware
 
 from agent_executor import SimpleAgentExecutor
+from concurrency import ConcurrencyLimiter, ConcurrencyLimitMiddleware
 from fx_agent import FxAgent
 from utils import setup_logger
 
@@ -24,6 +27,23 @@ def get_agent(agent_card: AgentCard):
         raise
 
 
+def build_lifespan(agent):
+    """
+    Build the lifespan of the server app, which starts the agent's MCP
+    servers once at startup and shuts them down with the server.
+    """
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await agent.start()
+        try:
+            yield
+        finally:
+            await agent.stop()
+
+    return lifespan
+
+
 def parse_arguments() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="A2A Agent Server")
     parser.add_argument(
@@ -44,6 +64,19 @@ def parse_arguments() -> argparse.Namespace:
         default="0.0.0.0",
         help="Host to bind the server to (default: 0.0.0.0)",
     )
+    parser.add_argument(
+        "--max-concurrent",
+        type=int,
+        default=8,
+        help="Maximum number of messages processed at once (default: 8)",
+    )
+    parser.add_argument(
+        "--max-queued",
+        type=int,
+        default=32,
+        help="Maximum number of messages waiting to be processed, beyond"
+        " which requests are rejected with 429 (default: 32)",
+    )
     return parser.parse_args()
 
 
@@ -55,8 +88,9 @@ def main():
             data = json.load(file)
         agent_card = AgentCard(**data)
 
+        agent = get_agent(agent_card)
         request_handler = DefaultRequestHandler(
-            agent_executor=SimpleAgentExecutor(agent=get_agent(agent_card)),
+            agent_executor=SimpleAgentExecutor(agent=agent),
             task_store=InMemoryTaskStore(),
         )
 
@@ -64,7 +98,18 @@ def main():
             agent_card=agent_card, http_handler=request_handler
         )
 
-        uvicorn.run(server.build(), host=args.host, port=args.port)
+        # Bound the requests processed at once, and reject the requests
+        # beyond the queue limit instead of letting them pile up
+        limiter = ConcurrencyLimiter(args.max_concurrent, args.max_queued)
+        middleware = [Middleware(ConcurrencyLimitMiddleware, limiter=limiter)]
+
+        uvicorn.run(
+            server.build(
+                lifespan=build_lifespan(agent), middleware=middleware
+            ),
+            host=args.host,
+            port=args.port,
+        )
 
     except Exception as err:
         logger.error("An error occurred during server startup: %s", err)
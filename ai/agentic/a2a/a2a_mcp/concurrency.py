@@ -0,0 +1,149 @@
+import json
+import asyncio
+from utils import setup_logger
+
+logger = setup_logger(__name__, level="INFO")
+
+# The JSON-RPC methods which run the agent. The others (e.g. tasks/get) are
+# cheap, and are not limited, so polling clients are not throttled.
+LIMITED_METHODS = {"message/send", "message/stream"}
+
+
+class OverloadedError(Exception):
+    """The server has no capacity left for another request."""
+
+
+class ConcurrencyLimiter:
+    """
+    Limit the number of requests processed at once. Up to `max_concurrent`
+    requests run concurrently, up to `max_queued` more wait for a slot, and
+    the requests beyond that are rejected at once instead of piling up.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_queued: int = 32):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.semaphore = asyncio.BoundedSemaphore(max_concurrent)
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        """
+        Wait for a slot to process a request.
+
+        Raises:
+            OverloadedError: If the queue of waiting requests is full
+        """
+        if self.semaphore.locked() and self.queued >= self.max_queued:
+            self.rejected += 1
+            raise OverloadedError(
+                f"{self.active} requests running and {self.queued} queued."
+            )
+        self.queued += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self.semaphore.release()
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    ASGI middleware which runs the A2A JSON-RPC calls which run the agent
+    (message/send and message/stream) through a ConcurrencyLimiter, and
+    answers 429 Too Many Requests when it is overloaded. A slot is held until the response is sent, including the
+    whole event stream of a streaming request.
+    """
+
+    def __init__(self, app, limiter: ConcurrencyLimiter, retry_after=1):
+        self.app = app
+        self.limiter = limiter
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        # The body is read to get the JSON-RPC method, and then replayed to
+        # the app
+        body = await self._read_body(receive)
+        receive = self._replay(body, receive)
+        if self._method(body) not in LIMITED_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.limiter.acquire()
+        except OverloadedError as err:
+            logger.warning("Rejected a request: %s", err)
+            await self._reject(send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    def _replay(body, receive):
+        """Get a receive callable which returns the body read already."""
+        replayed = False
+
+        async def replay_receive():
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return replay_receive
+
+    @staticmethod
+    def _method(body):
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return None
+        return request.get("method") if isinstance(request, dict) else None
+
+    async def _reject(self, send):
+        body = json.dumps(
+            {
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {
+                    "code": -32000,
+                    "message": "Server overloaded, please retry later.",
+                },
+            }
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(self.retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -1,3 +1,4 @@
+import asyncio
 from anthropic import AnthropicBedrock
 from mcp_client import MCPClient
 from utils import setup_logger, cprint
@@ -9,26 +10,50 @@ class FxAgent:
     """A simple agent that finds the Foreign Exchange (FX) rate for a given
     currency pair. This agent is a MCP host that uses mcp servers (i.e. fxrate)
     to process requests, orchestrate, and return the final response.
+
+    The MCP servers are started once by `start` and their sessions are shared
+    by all the requests, with periodic health checks which restart the
+    servers that crashed or stopped responding. Each request keeps its own
+    conversation state, so concurrent requests only share the sessions.
     """
 
-    def __init__(self):
+    def __init__(self, health_check_interval: float = 10.0):
         self.anthropic = AnthropicBedrock()
         self.mcp_client = MCPClient()
         self.mcp_server_config = "mcp_server_config.json"
+        self.health_check_interval = health_check_interval
+        self.health_task = None
         self.system_message = """You are a helpful assistant that provides foreign exchange rates.
 
 Follow these guidelines:
 - Use available tools to fetch the latest exchange rates for currency pairs.
+- When several currency pairs are needed, fetch all of them in one call with the tool for several pairs.
 - Provide result in the format:
 `<base_currency> to <quote_currency> exchange rate: <rate>`
 """
 
+    async def start(self):
+        """Start the MCP servers and their health checks."""
+        await self.mcp_client.connect_to_servers(
+            self.mcp_server_config, concurrent=True, ignore_errors=True
+        )
+        self.health_task = asyncio.create_task(
+            self.mcp_client.monitor_servers(self.health_check_interval)
+        )
+
+    async def stop(self):
+        """Stop the health checks and shut down the MCP servers."""
+        if self.health_task is not None:
+            self.health_task.cancel()
+            await asyncio.gather(self.health_task, return_exceptions=True)
+            self.health_task = None
+        await self.mcp_client.cleanup()
+
     async def invoke(self, request: str) -> str:
         """Process a request using the AI agent with tool capabilities."""
         logger.info("Request: %s", request)
 
         try:
-            await self.mcp_client.connect_to_servers(self.mcp_server_config)
             response = await self.process_query(request)
             return response
 
@@ -36,34 +61,55 @@ Follow these guidelines:
             logger.error("Error: %s", err, exc_info=True)
             return f"Error: {str(err)}"
 
-        finally:
-            await self.mcp_client.cleanup()
+    async def stream(self, request: str):
+        """
+        Process a request like `invoke`, yielding the progress of the agent
+        loop as it runs.
+
+        Yields:
+            Event dicts with a `type` of "text" (intermediate text of the
+            model), "tool_call" (with the tool `name` and `input`),
+            "tool_result" (with the tool `name` and `text`), and finally
+            "response" (with the final `text`) or "error" (with the `text`)
+        """
+        logger.info("Request: %s", request)
+
+        try:
+            async for event in self.stream_query(request):
+                yield event
+
+        except Exception as err:
+            logger.error("Error: %s", err, exc_info=True)
+            yield {"type": "error", "text": f"Error: {str(err)}"}
 
     async def process_query(self, query: str) -> str:
         """Process a query using the AI agent and return the final response."""
+        final_response = ""
+        async for event in self.stream_query(query):
+            if event["type"] == "response":
+                final_response = event["text"]
+        return final_response
+
+    async def stream_query(self, query: str):
+        """Process a query using the AI agent, yielding its events."""
         messages = []
 
         # Add current query
         messages.append({"role": "user", "content": query})
 
-        # Create clean tools list for Anthropic API (without any additional or
-        # non-serializable data)
-        tools_for_anthropic = []
-        for tool in self.mcp_client.available_tools:
-            tools_for_anthropic.append(
-                {
-                    "name": tool["name"],
-                    "description": tool["description"],
-                    "input_schema": tool["input_schema"],
-                }
-            )
+        # Tools list for Anthropic API, cached by the client until the
+        # available tools change
+        tools_for_anthropic = self.mcp_client.get_tools_payload()
 
         final_response = ""
 
         while True:
             model = "us.anthropic.claude-3-7-sonnet-20250219-v1:0"
             max_tokens = 2048
-            response = self.anthropic.messages.create(
+            # The client is blocking, so it runs in a thread to keep the
+            # event loop (and the events of the other requests) going
+            response = await asyncio.to_thread(
+                self.anthropic.messages.create,
                 model=model,
                 max_tokens=max_tokens,
                 tools=tools_for_anthropic,
@@ -78,17 +124,33 @@ Follow these guidelines:
                 if content.type == "text":
                     final_response = content.text
                     assistant_content.append(content)
+                    if response.stop_reason == "tool_use":
+                        yield {"type": "text", "text": content.text}
                 elif content.type == "tool_use":
                     has_tool_use = True
                     assistant_content.append(content)
                     messages.append(
                         {"role": "assistant", "content": assistant_content}
                     )
+                    yield {
+                        "type": "tool_call",
+                        "name": content.name,
+                        "input": content.input,
+                    }
                     try:
                         result = await self.mcp_client.execute_tool(
                             content.name, content.input
                         )
                         cprint(f"Tool result: {result}", color="blue")
+                        yield {
+                            "type": "tool_result",
+                            "name": content.name,
+                            "text": " ".join(
+                                item.text
+                                for item in result.content
+                                if hasattr(item, "text")
+                            ),
+                        }
                         messages.append(
                             {
                                 "role": "user",
@@ -115,4 +177,7 @@ Follow these guidelines:
             if not has_tool_use:
                 break
 
-        return final_response or "No response generated"
+        yield {
+            "type": "response",
+            "text": final_response or "No response generated",
+        }
@@ -0,0 +1,282 @@
+import time
+import asyncio
+from utils import setup_logger
+
+logger = setup_logger(__name__, level="INFO")
+
+# The currency of the legs used to derive cross rates
+PIVOT_CURRENCY = "USD"
+
+
+class YahooQuoteSource:
+    """Quotes from Yahoo Finance (yfinance is imported on first use)."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def fetch(self, pairs):
+        """
+        Fetch the latest rates of currency pairs (blocking).
+
+        Args:
+            pairs: List of (base, quote) tuples
+
+        Returns:
+            Dictionary of (base, quote) to rate, without the pairs which are
+            not available
+        """
+        import yfinance as yf
+
+        self.requests += 1
+        symbols = {f"{base}{quote}=X": (base, quote) for base, quote in pairs}
+        # One bulk download of the 1 minute bars of all the symbols
+        data = yf.download(
+            list(symbols),
+            period="1d",
+            interval="1m",
+            group_by="ticker",
+            progress=False,
+        )
+        rates = {}
+        for symbol, pair in symbols.items():
+            try:
+                if data.columns.nlevels == 1:
+                    # A single symbol without the ticker level
+                    closes = data["Close"]
+                else:
+                    closes = data[symbol]["Close"]
+            except KeyError:
+                continue
+            closes = closes.dropna()
+            if not closes.empty:
+                # The most recent close price
+                rates[pair] = float(closes.iloc[-1])
+        return rates
+
+
+class StubQuoteSource:
+    """
+    A local quote source with fixed rates against USD, which takes `latency`
+    seconds per request, to test the quote cache offline.
+    """
+
+    USD_RATES = {
+        "USD": 1.0,
+        "EUR": 0.92,
+        "GBP": 0.79,
+        "JPY": 149.5,
+        "AUD": 1.52,
+        "CAD": 1.36,
+        "CHF": 0.88,
+        "CNY": 7.24,
+        "INR": 83.2,
+        "NZD": 1.65,
+    }
+
+    def __init__(self, latency: float = 0.2, usd_rates: dict = None):
+        self.latency = latency
+        self.usd_rates = usd_rates or self.USD_RATES
+        self.requests = 0
+
+    def fetch(self, pairs):
+        """Fetch the rates of currency pairs (see YahooQuoteSource.fetch)."""
+        time.sleep(self.latency)
+        self.requests += 1
+        return {
+            (base, quote): self.usd_rates[quote] / self.usd_rates[base]
+            for base, quote in pairs
+            if base in self.usd_rates and quote in self.usd_rates
+        }
+
+
+def get_quote_source(name: str):
+    """Get a quote source by name ("yahoo" or "stub")."""
+    if name == "yahoo":
+        return YahooQuoteSource()
+    if name == "stub":
+        return StubQuoteSource()
+    raise ValueError(f"Unknown quote source '{name}'.")
+
+
+class QuoteCache:
+    """
+    An in-process cache of FX rates in front of a quote source.
+
+    A cached rate is used for `max_age` seconds, also for the inverse pair.
+    Concurrent requests for a pair which is not cached are coalesced into a
+    single upstream request (single flight). Cross rates (e.g. AUD/EUR) are
+    derived from the cached USD legs (USD/AUD and USD/EUR) when both are
+    fresh, and are fetched from them if the pair itself is not available.
+    The pairs requested together are fetched in one upstream request.
+    """
+
+    def __init__(self, source, max_age: float = 60.0):
+        """
+        Args:
+            source: The quote source (see YahooQuoteSource)
+            max_age: Seconds for which a cached rate is fresh
+        """
+        self.source = source
+        self.max_age = max_age
+        # (base, quote) to (rate, time it was fetched)
+        self.rates = {}
+        # Tasks of the upstream requests in flight, by pair
+        self.in_flight = {}
+        self.stats = {
+            "hits": 0,
+            "derived": 0,
+            "coalesced": 0,
+            "misses": 0,
+            "upstream_requests": 0,
+        }
+
+    def _cached(self, base, quote, now):
+        """Get a fresh rate of a pair, or of its inverse, or None."""
+        entry = self.rates.get((base, quote))
+        if entry and now - entry[1] <= self.max_age:
+            return entry[0]
+        entry = self.rates.get((quote, base))
+        if entry and now - entry[1] <= self.max_age:
+            return 1 / entry[0]
+        return None
+
+    def lookup(self, base, quote):
+        """
+        Get a rate from the cache only: a fresh rate of the pair, or a cross
+        rate derived from fresh USD legs. Returns None if neither is cached.
+        """
+        base, quote = base.upper(), quote.upper()
+        if base == quote:
+            return 1.0
+        now = time.monotonic()
+        rate = self._cached(base, quote, now)
+        if rate is not None:
+            self.stats["hits"] += 1
+            return rate
+
+        if PIVOT_CURRENCY not in (base, quote):
+            base_leg = self._cached(PIVOT_CURRENCY, base, now)
+            quote_leg = self._cached(PIVOT_CURRENCY, quote, now)
+            if base_leg is not None and quote_leg is not None:
+                self.stats["derived"] += 1
+                return quote_leg / base_leg
+        return None
+
+    def store(self, rates):
+        """Cache rates fetched from the quote source."""
+        now = time.monotonic()
+        for pair, rate in rates.items():
+            self.rates[pair] = (rate, now)
+
+    async def get_rate(self, base, quote):
+        """
+        Get the rate of a currency pair, from the cache or the quote source.
+
+        Returns:
+            The rate, or None if it is not available
+        """
+        rate, _ = (await self.get_rates([(base, quote)]))[0]
+        return rate
+
+    async def get_rates(self, pairs):
+        """
+        Get the rates of several currency pairs. The pairs which are not in
+        the cache are fetched together in one upstream request, and the ones
+        still missing are derived from the USD legs (fetched together in a
+        second request if needed).
+
+        Args:
+            pairs: List of (base, quote) tuples
+
+        Returns:
+            List of (rate, source) tuples in the same order, where the source
+            is "cache", "upstream", "derived" or "unavailable" (with a None
+            rate)
+        """
+        pairs = [(base.upper(), quote.upper()) for base, quote in pairs]
+        results = [None] * len(pairs)
+        missing = {}
+        for index, pair in enumerate(pairs):
+            rate = self.lookup(*pair)
+            if rate is not None:
+                results[index] = (rate, "cache")
+            else:
+                missing.setdefault(pair, []).append(index)
+        if not missing:
+            return results
+
+        fetched = await self._fetch(list(missing))
+        legs = set()
+        for pair, indexes in missing.items():
+            if fetched.get(pair) is not None:
+                for index in indexes:
+                    results[index] = (fetched[pair], "upstream")
+            elif PIVOT_CURRENCY not in pair:
+                legs.update(pair)
+
+        # Fetch the USD legs of the pairs which are still missing, unless
+        # they are fresh in the cache
+        now = time.monotonic()
+        legs = [
+            (PIVOT_CURRENCY, currency)
+            for currency in sorted(legs)
+            if self._cached(PIVOT_CURRENCY, currency, now) is None
+        ]
+        if legs:
+            await self._fetch(legs)
+
+        for pair, indexes in missing.items():
+            if results[indexes[0]] is not None:
+                continue
+            rate = self.lookup(*pair)
+            result = (rate, "derived" if rate is not None else "unavailable")
+            for index in indexes:
+                results[index] = result
+        return results
+
+    async def _fetch(self, pairs):
+        """
+        Fetch the rates of pairs in one upstream request, joining the
+        requests in flight for any of them.
+
+        Returns:
+            Dictionary of (base, quote) to rate, for the available pairs
+        """
+        tasks = {}
+        new_pairs = []
+        for pair in pairs:
+            task = self.in_flight.get(pair)
+            if task is not None:
+                self.stats["coalesced"] += 1
+                tasks[pair] = task
+            else:
+                self.stats["misses"] += 1
+                new_pairs.append(pair)
+
+        if new_pairs:
+            # The request runs in its own task, so it completes for the
+            # other callers even if the first one is cancelled
+            task = asyncio.create_task(self._fetch_upstream(new_pairs))
+            for pair in new_pairs:
+                self.in_flight[pair] = task
+                tasks[pair] = task
+            task.add_done_callback(lambda _: self._clear_in_flight(new_pairs))
+
+        rates = {}
+        for task in set(tasks.values()):
+            rates.update(await asyncio.shield(task))
+        return {pair: rates[pair] for pair in pairs if pair in rates}
+
+    def _clear_in_flight(self, pairs):
+        for pair in pairs:
+            self.in_flight.pop(pair, None)
+
+    async def _fetch_upstream(self, pairs):
+        self.stats["upstream_requests"] += 1
+        try:
+            rates = await asyncio.to_thread(self.source.fetch, pairs)
+        except Exception as err:
+            logger.error("Error fetching exchange rates %s: %s", pairs, err)
+            return {}
+        self.store(rates)
+        return rates
@@ -1,15 +1,38 @@
+import os
+import json
 from typing import Optional
-import yfinance as yf
 from mcp.server.fastmcp import FastMCP
+from fx_quotes import QuoteCache, get_quote_source
 from utils import setup_logger
 
 logger = setup_logger(__name__, level="INFO")
 
+# The rates are cached for FX_QUOTE_MAX_AGE seconds, in front of the quote
+# source set by FX_QUOTE_SOURCE ("yahoo", or "stub" to run offline)
+quote_cache = QuoteCache(
+    get_quote_source(os.environ.get("FX_QUOTE_SOURCE", "yahoo")),
+    max_age=float(os.environ.get("FX_QUOTE_MAX_AGE", "60")),
+)
+
+MAX_PAIRS = 50
+
 mcp = FastMCP("fxrate")
 
 
+def parse_pair(pair: str) -> tuple:
+    """Parse a currency pair such as "USD/EUR", "USD-EUR" or "USDEUR"."""
+    text = pair.strip().upper()
+    for separator in ("/", "-", " "):
+        if separator in text:
+            base, _, quote = text.partition(separator)
+            return base.strip(), quote.strip()
+    if len(text) == 6:
+        return text[:3], text[3:]
+    raise ValueError(f"Invalid currency pair: {pair}")
+
+
 @mcp.tool()
-def fetch_exchange_rate(base: str, quote: str) -> Optional[float]:
+async def fetch_exchange_rate(base: str, quote: str) -> Optional[float]:
     """fetch current exchange rate for foreign exchange pair.
     Args:
         base: Base currency code (e.g., "USD")
@@ -17,20 +40,46 @@ def fetch_exchange_rate(base: str, quote: str) -> Optional[float]:
     Returns:
         Current exchange rate as a float, or None if not available.
     """
-    try:
-        # Create Yahoo Finance symbol
-        symbol = f"{base}{quote}=X"
+    return await quote_cache.get_rate(base, quote)
+
+
+@mcp.tool()
+async def fetch_exchange_rates(pairs: list[str]) -> str:
+    """fetch current exchange rates for several foreign exchange pairs at
+    once (e.g. to convert an amount into many currencies).
+    Args:
+        pairs: List of currency pairs (up to 50), e.g. ["EUR/USD", "EUR/JPY"]
+    Returns:
+        A table with one line per pair: the pair, its rate (or "n/a" if not
+        available) and where the rate comes from (cache, upstream, or
+        derived from the USD rates).
+    """
+    if not pairs:
+        raise ValueError("No currency pairs given.")
+    if len(pairs) > MAX_PAIRS:
+        raise ValueError(f"At most {MAX_PAIRS} pairs can be fetched.")
+    parsed = [parse_pair(pair) for pair in pairs]
 
-        ticker = yf.Ticker(symbol)
-        data = ticker.history(period="1d", interval="1m")
+    results = await quote_cache.get_rates(parsed)
+    lines = ["pair rate source"]
+    for (base, quote), (rate, source) in zip(parsed, results):
+        value = f"{rate:.6g}" if rate is not None else "n/a"
+        lines.append(f"{base}/{quote} {value} {source}")
+    return "\n".join(lines)
 
-        if not data.empty:
-            # Get the most recent close price.
-            return float(data["Close"].iloc[-1])
-    except Exception as err:
-        logger.error("Error fetching exchange rate: %s", err)
 
-    return None
+@mcp.resource("fx://cache-stats")
+def get_cache_stats() -> str:
+    """
+    This resource provides the hit and upstream request counts of the quote
+    cache.
+
+    Returns:
+        A JSON string with the cache statistics.
+    """
+    return json.dumps(
+        dict(quote_cache.stats, cached_pairs=len(quote_cache.rates))
+    )
 
 
 if __name__ == "__main__":
@@ -1,10 +1,20 @@
 import logging
 import asyncio
+import argparse
 from typing import Any
 from uuid import uuid4
 import httpx
 from a2a.client import A2ACardResolver, A2AClient
-from a2a.types import AgentCard, MessageSendParams, SendMessageRequest
+from a2a.types import (
+    AgentCard,
+    JSONRPCErrorResponse,
+    MessageSendParams,
+    SendMessageRequest,
+    SendStreamingMessageRequest,
+    Task,
+    TaskArtifactUpdateEvent,
+    TaskStatusUpdateEvent,
+)
 from utils import setup_logger
 
 logger = setup_logger(__name__, level="INFO")
@@ -13,7 +23,49 @@ PUBLIC_AGENT_CARD_PATH = "/.well-known/agent.json"
 BASE_URL = "http://localhost:9999"
 
 
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="A2A Host")
+    parser.add_argument(
+        "--message",
+        type=str,
+        default="USD to AUD",
+        help="Message to send to the agent (default: USD to AUD)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the task updates of the agent as they happen",
+    )
+    return parser.parse_args()
+
+
+def print_event(event) -> None:
+    """Print an event of a streamed response as it arrives."""
+    if isinstance(event, Task):
+        print(f"[{event.status.state.value}] Task {event.id}")
+    elif isinstance(event, TaskStatusUpdateEvent):
+        text = ""
+        if event.status.message:
+            text = " ".join(
+                part.root.text
+                for part in event.status.message.parts
+                if hasattr(part.root, "text")
+            )
+        print(f"[{event.status.state.value}] {text}")
+    elif isinstance(event, TaskArtifactUpdateEvent):
+        text = " ".join(
+            part.root.text
+            for part in event.artifact.parts
+            if hasattr(part.root, "text")
+        )
+        print(f"[{event.artifact.name}] {text}")
+    else:
+        print(event.model_dump(mode="json", exclude_none=True))
+
+
 async def main() -> None:
+    args = parse_arguments()
+
     # Increase the default timeout for HTTP requests as the agent may take
     # longer to respond, especially when communicating with LLMs
     timeout_config = httpx.Timeout(connect=10, read=120, write=20, pool=10)
@@ -54,11 +106,26 @@ async def main() -> None:
         message_payload: dict[str, Any] = {
             "message": {
                 "role": "user",
-                "parts": [{"kind": "text", "text": "USD to AUD"}],
+                "parts": [{"kind": "text", "text": args.message}],
                 "messageId": uuid4().hex,
             },
         }
 
+        if args.stream:
+            # The events are printed as they arrive, so the first progress
+            # shows up without waiting for the whole task
+            request = SendStreamingMessageRequest(
+                id=str(uuid4()), params=MessageSendParams(**message_payload)
+            )
+            async for response in client.send_message_streaming(request):
+                # A JSON-RPC error response has an error instead of a result
+                if isinstance(response.root, JSONRPCErrorResponse):
+                    error = response.root.error
+                    print(f"[error] {error.message} (code {error.code})")
+                    break
+                print_event(response.root.result)
+            return
+
         request = SendMessageRequest(
             id=str(uuid4()), params=MessageSendParams(**message_payload)
         )
@@ -0,0 +1,100 @@
+import time
+import asyncio
+import argparse
+from uuid import uuid4
+import httpx
+from a2a.client import A2AClient, A2AClientHTTPError
+from a2a.types import MessageSendParams, SendMessageRequest
+
+
+async def send_request(client, message):
+    """
+    Send one message to the agent.
+
+    Returns:
+        A tuple of (outcome, seconds), where the outcome is "ok", "rejected"
+        (429), or "error"
+    """
+    request = SendMessageRequest(
+        id=str(uuid4()),
+        params=MessageSendParams(
+            message={
+                "role": "user",
+                "parts": [{"kind": "text", "text": message}],
+                "messageId": uuid4().hex,
+            }
+        ),
+    )
+    started = time.perf_counter()
+    try:
+        response = await client.send_message(request)
+        outcome = "error" if hasattr(response.root, "error") else "ok"
+    except A2AClientHTTPError as err:
+        outcome = "rejected" if err.status_code == 429 else "error"
+    except Exception:
+        outcome = "error"
+    return outcome, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run_load_test(args):
+    limits = httpx.Limits(max_connections=args.requests)
+    timeout = httpx.Timeout(connect=10, read=300, write=20, pool=300)
+    async with httpx.AsyncClient(
+        limits=limits, timeout=timeout
+    ) as httpx_client:
+        client = A2AClient(httpx_client=httpx_client, url=args.url)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(send_request(client, args.message) for _ in range(args.requests))
+        )
+        elapsed = time.perf_counter() - started
+
+    print(f"{args.requests} parallel requests in {elapsed:.2f}s")
+    for outcome in ("ok", "rejected", "error"):
+        latencies = [
+            seconds for result, seconds in results if result == outcome
+        ]
+        if not latencies:
+            print(f"  {outcome}: 0")
+            continue
+        print(
+            f"  {outcome}: {len(latencies)}"
+            f" (p50 {percentile(latencies, 0.5):.2f}s,"
+            f" p95 {percentile(latencies, 0.95):.2f}s,"
+            f" max {max(latencies):.2f}s)"
+        )
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Load test of the A2A agent server with parallel requests"
+    )
+    parser.add_argument(
+        "--url",
+        type=str,
+        default="http://localhost:9999/",
+        help="URL of the agent server (default: http://localhost:9999/)",
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=64,
+        help="Number of parallel requests (default: 64)",
+    )
+    parser.add_argument(
+        "--message",
+        type=str,
+        default="USD to AUD",
+        help="Message sent to the agent (default: USD to AUD)",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_load_test(parse_arguments()))
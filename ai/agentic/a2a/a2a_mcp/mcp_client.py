@@ -1,4 +1,6 @@
 import json
+import time
+import asyncio
 from contextlib import AsyncExitStack
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
@@ -7,6 +9,52 @@ from utils import setup_logger
 logger = setup_logger(__name__, level="INFO")
 
 
+class ResourceRouter:
+    """
+    Routes resource URIs to the servers which provide them. Static resource
+    URIs are matched exactly, and resource templates (e.g.
+    `catalog://{category}`) and protocols (e.g. `catalog://`) are matched on
+    their longest literal prefix.
+    """
+
+    def __init__(self):
+        self.uris = {}
+        self.prefixes = {}
+        # Distinct prefix lengths (longest first), so a lookup only probes
+        # one dictionary key per length instead of scanning all prefixes.
+        self.prefix_lengths = []
+
+    def add_uri(self, uri, server_name):
+        self.uris.setdefault(uri, server_name)
+
+    def add_prefix(self, prefix, server_name):
+        self.prefixes.setdefault(prefix, server_name)
+        if len(prefix) not in self.prefix_lengths:
+            self.prefix_lengths.append(len(prefix))
+            self.prefix_lengths.sort(reverse=True)
+
+    def add_template(self, uri_template, server_name):
+        """Add a template by the literal part before its first parameter."""
+        self.add_prefix(uri_template.split("{", maxsplit=1)[0], server_name)
+
+    def route(self, uri):
+        """Return the name of the server for the URI, or None."""
+        server_name = self.uris.get(uri)
+        if server_name:
+            return server_name
+
+        for length in self.prefix_lengths:
+            server_name = self.prefixes.get(uri[:length])
+            if server_name:
+                return server_name
+        return None
+
+    def clear(self):
+        self.uris.clear()
+        self.prefixes.clear()
+        self.prefix_lengths.clear()
+
+
 class MCPClient:
     """
     This class manages connections to MCP servers (separate sessions for each
@@ -17,90 +65,371 @@ class MCPClient:
     def __init__(self):
         self.exit_stack = AsyncExitStack()
         self.server_sessions = {}
+        self.server_tasks = {}
+        self.server_connect_times = {}
+        # Configs of the connected servers, to restart them if they crash
+        self.server_configs = {}
+        self.reconnect_locks = {}
         self.available_tools = []
         self.available_prompts = []
         self.available_resources = []
+        self.available_resource_templates = []
+
+        # Tools payload for the LLM, rebuilt only when the tools change
+        self.tools_version = 0
+        self.tools_payload_cache = {}
+
+        # Indexes for routing the calls to the servers
+        self.tool_index = {}
+        self.prompt_index = {}
+        self.resource_router = ResourceRouter()
+
+    async def connect_to_servers(
+        self, config_file, concurrent=False, ignore_errors=False
+    ):
+        """
+        Connect to all the servers defined in the config file.
 
-    async def connect_to_servers(self, config_file):
+        Args:
+            config_file: Path to the JSON file containing `mcpServers`
+            concurrent: Start all the servers and run their discovery calls
+                in parallel instead of one server at a time
+            ignore_errors: Log and skip the servers which fail to connect,
+                instead of aborting the startup
+        """
         try:
             with open(config_file, "r", encoding="utf-8") as file:
                 data = json.load(file)
             servers = data.get("mcpServers", {})
-            for server_name, server_config in servers.items():
-                logger.info("Connecting to server: %s", server_name)
-                await self.connect_to_server(server_name, server_config)
         except Exception as err:
             logger.error("Error loading server config: %s", err)
             raise
 
+        if concurrent:
+            await self._connect_to_servers_concurrently(servers, ignore_errors)
+            return
+
+        for server_name, server_config in servers.items():
+            logger.info("Connecting to server: %s", server_name)
+            try:
+                await self.connect_to_server(server_name, server_config)
+            except Exception:
+                if not ignore_errors:
+                    raise
+
+    async def _connect_to_servers_concurrently(self, servers, ignore_errors):
+        # Every server session runs in its own task (see _open_session), so
+        # the servers can be started and discovered all at once.
+        for server_name in servers:
+            logger.info("Connecting to server: %s", server_name)
+        results = await asyncio.gather(
+            *(
+                self.connect_to_server(server_name, server_config)
+                for server_name, server_config in servers.items()
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            # Errors are already logged by connect_to_server
+            if isinstance(result, Exception) and not ignore_errors:
+                raise result
+
     async def connect_to_server(self, server_name, server_config):
-        # Check for duplicate server names
+        self._check_duplicate_server(server_name)
+
+        self.server_configs[server_name] = server_config
+        started = time.perf_counter()
+        try:
+            opened = await self._open_session(server_config)
+            await self._initialize_session(server_name, opened, started)
+        except Exception as err:
+            logger.error(
+                "Error connecting to server '%s': %s", server_name, err
+            )
+            raise
+
+    def _check_duplicate_server(self, server_name):
+        """Raise an error if a server with the same name already exists."""
         if server_name in self.server_sessions:
             raise ValueError(
                 f"Duplicate server name '{server_name}' found."
                 " Each server must have a unique name."
             )
 
-        server_params = StdioServerParameters(**server_config)
+    async def _open_session(self, server_config):
+        """
+        Spawn the server process and open a client session to it.
+
+        The cancel scopes inside stdio_client and ClientSession must be exited
+        by the same task, in the reverse order they were entered. So each
+        session is kept open by its own task until it is stopped, either by
+        disconnect_server or by the shared exit stack on cleanup. This lets a
+        single server be disconnected without affecting the others.
+        """
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+        task = asyncio.create_task(
+            self._run_session(server_config, ready, stop)
+        )
+        self.exit_stack.push_async_callback(self._stop_session, task, stop)
+
+        session = await ready
+        return session, (task, stop)
+
+    async def _run_session(self, server_config, ready, stop):
+        """Keep a session open until the stop event is set."""
         try:
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(read, write)
+            server_params = StdioServerParameters(**server_config)
+            async with stdio_client(server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    ready.set_result(session)
+                    await stop.wait()
+        except Exception as err:
+            if not ready.done():
+                ready.set_exception(err)
+            else:
+                logger.error("Server session closed with error: %s", err)
+        finally:
+            if not ready.done():
+                ready.cancel()
+
+    async def _stop_session(self, task, stop):
+        stop.set()
+        await task
+
+    async def _initialize_session(self, server_name, opened, started):
+        """Initialize the session and read the server's primitives."""
+        session, session_task = opened
+        await session.initialize()
+
+        # The discovery calls are independent, so send them all at once
+        (
+            tools_response,
+            prompts_response,
+            resources_response,
+            templates_response,
+        ) = await asyncio.gather(
+            session.list_tools(),
+            session.list_prompts(),
+            session.list_resources(),
+            session.list_resource_templates(),
+        )
+
+        # Store session in the dictionary
+        self.server_sessions[server_name] = session
+        self.server_tasks[server_name] = session_task
+
+        # Read available tools
+        for tool in tools_response.tools:
+            self.available_tools.append(
+                {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "input_schema": tool.inputSchema,
+                    "server_name": server_name,
+                }
             )
-            await session.initialize()
 
-            # Store session in the dictionary
-            self.server_sessions[server_name] = session
+        # Read available prompts
+        if prompts_response and prompts_response.prompts:
+            for prompt in prompts_response.prompts:
+                self.available_prompts.append(
+                    {
+                        "name": prompt.name,
+                        "description": prompt.description,
+                        "arguments": prompt.arguments,
+                        "server_name": server_name,
+                    }
+                )
+
+        # Read available resources
+        if resources_response and resources_response.resources:
+            for resource in resources_response.resources:
+                uri = str(resource.uri)
+                self.available_resources.append(
+                    {
+                        "name": resource.name,
+                        "uri": uri,
+                        "description": resource.description,
+                        "protocol": uri.split("://", maxsplit=1)[0] + "://",
+                        "server_name": server_name,
+                    }
+                )
 
-            # Read available tools
-            response = await session.list_tools()
-            for tool in response.tools:
-                self.available_tools.append(
+        # Read available resource templates
+        if templates_response and templates_response.resourceTemplates:
+            for template in templates_response.resourceTemplates:
+                self.available_resource_templates.append(
                     {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "input_schema": tool.inputSchema,
+                        "name": template.name,
+                        "uri_template": template.uriTemplate,
+                        "description": template.description,
                         "server_name": server_name,
                     }
                 )
 
-            # Read available prompts
-            prompts_response = await session.list_prompts()
-            if prompts_response and prompts_response.prompts:
-                for prompt in prompts_response.prompts:
-                    self.available_prompts.append(
-                        {
-                            "name": prompt.name,
-                            "description": prompt.description,
-                            "arguments": prompt.arguments,
-                            "server_name": server_name,
-                        }
-                    )
-            # Read available resources
-            resources_response = await session.list_resources()
-            if resources_response and resources_response.resources:
-                for resource in resources_response.resources:
-                    self.available_resources.append(
-                        {
-                            "name": resource.name,
-                            "uri": str(resource.uri),
-                            "description": resource.description,
-                            "protocol": str(resource.uri).split(
-                                "://", maxsplit=1
-                            )[0]
-                            + "://",
-                            "server_name": server_name,
-                        }
-                    )
+        self._index_server(server_name)
+        self._tools_changed()
+
+        self.server_connect_times[server_name] = time.perf_counter() - started
+        logger.info(
+            "Connected to server '%s' in %.2fs",
+            server_name,
+            self.server_connect_times[server_name],
+        )
+
+    async def disconnect_server(self, server_name):
+        """Close the session of a server and remove its primitives."""
+        self._get_session(server_name)
+        session_task = self.server_tasks.pop(server_name)
+        del self.server_sessions[server_name]
+        self.server_connect_times.pop(server_name, None)
 
+        self.available_tools = [
+            t for t in self.available_tools if t["server_name"] != server_name
+        ]
+        self.available_prompts = [
+            p
+            for p in self.available_prompts
+            if p["server_name"] != server_name
+        ]
+        self.available_resources = [
+            r
+            for r in self.available_resources
+            if r["server_name"] != server_name
+        ]
+        self.available_resource_templates = [
+            t
+            for t in self.available_resource_templates
+            if t["server_name"] != server_name
+        ]
+        self._rebuild_indexes()
+        self._tools_changed()
+
+        await self._stop_session(*session_task)
+        logger.info("Disconnected from server: %s", server_name)
+
+    async def ping_server(self, server_name, timeout=5.0):
+        """
+        Check that a server is alive: its session is open and it answers a
+        ping within `timeout` seconds.
+        """
+        session = self.server_sessions.get(server_name)
+        if session is None or self.server_tasks[server_name][0].done():
+            return False
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout)
         except Exception as err:
-            logger.error(
-                "Error connecting to server '%s': %s", server_name, err
+            logger.warning("Server '%s' did not answer: %r", server_name, err)
+            return False
+        return True
+
+    async def reconnect_server(self, server_name):
+        """Restart a server (e.g. after it crashed) and reconnect to it."""
+        lock = self.reconnect_locks.setdefault(server_name, asyncio.Lock())
+        async with lock:
+            if server_name in self.server_sessions:
+                await self.disconnect_server(server_name)
+            logger.info("Reconnecting to server: %s", server_name)
+            await self.connect_to_server(
+                server_name, self.server_configs[server_name]
             )
-            raise
+
+    async def check_servers(self, timeout=5.0):
+        """
+        Ping all the servers, and restart the ones which are not healthy
+        (including the ones which failed to restart before).
+
+        Returns:
+            The names of the restarted servers
+        """
+        server_names = list(self.server_configs)
+        healthy = await asyncio.gather(
+            *(self.ping_server(name, timeout) for name in server_names)
+        )
+        restarted = []
+        for server_name, ok in zip(server_names, healthy):
+            if ok:
+                continue
+            try:
+                await self.reconnect_server(server_name)
+                restarted.append(server_name)
+            except Exception:
+                # Logged by connect_to_server, and retried at the next check
+                pass
+        return restarted
+
+    async def monitor_servers(self, interval=10.0, timeout=5.0):
+        """Check the health of the servers every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_servers(timeout)
+            except Exception as err:
+                logger.error("Error checking the servers: %s", err)
+
+    def _index_server(self, server_name):
+        """
+        Add the primitives of a server to the routing indexes. When more than
+        one server provides the same name, the first connected one is used.
+        """
+        for tool in self.available_tools:
+            if tool["server_name"] == server_name:
+                self.tool_index.setdefault(tool["name"], tool)
+        for prompt in self.available_prompts:
+            if prompt["server_name"] == server_name:
+                self.prompt_index.setdefault(prompt["name"], prompt)
+        for resource in self.available_resources:
+            if resource["server_name"] == server_name:
+                self.resource_router.add_uri(resource["uri"], server_name)
+                self.resource_router.add_prefix(
+                    resource["protocol"], server_name
+                )
+        for template in self.available_resource_templates:
+            if template["server_name"] == server_name:
+                self.resource_router.add_template(
+                    template["uri_template"], server_name
+                )
+
+    def _rebuild_indexes(self):
+        """Rebuild the routing indexes from the connected servers."""
+        self.tool_index.clear()
+        self.prompt_index.clear()
+        self.resource_router.clear()
+        for server_name in self.server_sessions:
+            self._index_server(server_name)
+
+    def _tools_changed(self):
+        """Bump the tools version, so the cached tools payload is rebuilt."""
+        self.tools_version += 1
+        self.tools_payload_cache.clear()
+
+    def get_tools_payload(self, cache_control=False):
+        """
+        Get the available tools in the format expected by the Anthropic API
+        (without any additional or non-serializable data). The payload is
+        built once per tools version and shared, so it must not be modified.
+
+        Args:
+            cache_control: Mark the end of the tools block as a prompt caching
+                breakpoint, so the provider can reuse the tool definitions
+                across turns instead of processing them again.
+        """
+        key = (self.tools_version, cache_control)
+        payload = self.tools_payload_cache.get(key)
+        if payload is None:
+            payload = [
+                {
+                    "name": tool["name"],
+                    "description": tool["description"],
+                    "input_schema": tool["input_schema"],
+                }
+                for tool in self.available_tools
+            ]
+            if cache_control and payload:
+                payload[-1]["cache_control"] = {"type": "ephemeral"}
+            self.tools_payload_cache[key] = payload
+        return payload
 
     def _get_session(self, server_name):
         """Get session for a server with error handling."""
@@ -111,35 +440,41 @@ class MCPClient:
 
     async def execute_tool(self, tool_name, arguments):
         """Execute a tool call and return the result."""
-        tool_info = next(
-            (t for t in self.available_tools if t["name"] == tool_name),
-            None,
-        )
+        tool_info = self.tool_index.get(tool_name)
         if not tool_info:
             raise ValueError(f"Tool '{tool_name}' not found.")
 
         session = self._get_session(tool_info["server_name"])
         return await session.call_tool(tool_name, arguments=arguments)
 
+    async def execute_tools(self, tool_calls):
+        """
+        Execute tool calls concurrently (across the server sessions) and
+        return their results in the same order. A failed call returns its
+        exception instead of a result.
+
+        Args:
+            tool_calls: List of (tool_name, arguments) tuples
+        """
+        return await asyncio.gather(
+            *(
+                self.execute_tool(tool_name, arguments)
+                for tool_name, arguments in tool_calls
+            ),
+            return_exceptions=True,
+        )
+
     async def get_resource(self, resource_uri):
         """Read a resource and display its content."""
         try:
             if "://" not in resource_uri:
                 raise ValueError(f"Invalid resource URI: {resource_uri}")
 
-            protocol = resource_uri.split("://")[0] + "://"
-            resource_info = next(
-                (
-                    r
-                    for r in self.available_resources
-                    if r["protocol"] == protocol
-                ),
-                None,
-            )
-            if not resource_info:
-                raise ValueError(f"Protocol '{protocol}' not found.")
+            server_name = self.resource_router.route(resource_uri)
+            if not server_name:
+                raise ValueError(f"No server found for '{resource_uri}'.")
 
-            session = self._get_session(resource_info["server_name"])
+            session = self._get_session(server_name)
             result = await session.read_resource(uri=resource_uri)
 
             if result and result.contents:
@@ -153,10 +488,7 @@ class MCPClient:
 
     async def get_prompt(self, prompt_name, args):
         """Get a prompt with the given arguments and return its content."""
-        prompt_info = next(
-            (p for p in self.available_prompts if p["name"] == prompt_name),
-            None,
-        )
+        prompt_info = self.prompt_index.get(prompt_name)
         if not prompt_info:
             logger.warning("Prompt '%s' not found.", prompt_name)
             return
@@ -0,0 +1,166 @@
+import gc
+import time
+import random
+import argparse
+from catalog_engine import CatalogEngine
+
+CATEGORIES = ["Lifestyle", "Running", "Training", "Hiking", "Basketball"]
+SIZES = [str(size) for size in range(5, 14)]
+COLORS = ["Black", "White", "Red", "Green", "Blue", "Grey", "Brown"]
+VARIANTS_PER_PRODUCT = 5
+FEATURES = [
+    "lightweight",
+    "durable",
+    "breathable",
+    "cushioned",
+    "waterproof",
+    "responsive",
+    "stable",
+    "classic",
+    "retro",
+    "grippy",
+]
+USES = ["marathons", "trails", "the gym", "everyday wear", "the court"]
+
+QUERIES = [
+    {"category": "Running"},
+    {"size": "9", "color": "Black"},
+    {"category": "Training", "size": "10", "color": "Blue"},
+]
+
+TEXT_QUERIES = [
+    "lightweight running shoe for marathons",
+    "waterprof hikng",
+    "retro basketball",
+]
+
+
+def generate_catalog(skus, seed=42):
+    """Generate a synthetic catalog with the given number of SKUs."""
+    rng = random.Random(seed)
+    products = []
+    stock = {}
+    for index in range(skus // VARIANTS_PER_PRODUCT):
+        product_id = f"P{index:07d}"
+        products.append(
+            {
+                "product_id": product_id,
+                "name": f"Shoe {index}",
+                "description": (
+                    f"A {' and '.join(rng.sample(FEATURES, 2))} shoe"
+                    f" for {rng.choice(USES)}."
+                ),
+                "category": rng.choice(CATEGORIES),
+                "price": float(rng.randint(50, 250)),
+            }
+        )
+        stock[product_id] = [
+            {
+                "color": rng.choice(COLORS),
+                "size": rng.choice(SIZES),
+                "quantity": rng.randint(0, 30),
+            }
+            for _ in range(VARIANTS_PER_PRODUCT)
+        ]
+    return products, stock
+
+
+def linear_search(products, stock, category=None, size=None, color=None):
+    """The original search_products, which scans the whole catalog."""
+    results = []
+    filtered_products = products
+    if category:
+        filtered_products = [
+            p for p in products if p["category"].lower() == category.lower()
+        ]
+    for product in filtered_products:
+        inventory = stock.get(product["product_id"], [])
+        if size:
+            inventory = [item for item in inventory if item["size"] == size]
+        if color:
+            inventory = [
+                item
+                for item in inventory
+                if item["color"].lower() == color.lower()
+            ]
+        if inventory:
+            result = product.copy()
+            result["available_options"] = inventory
+            result["total_available"] = sum(i["quantity"] for i in inventory)
+            results.append(result)
+    return results
+
+
+def time_query(search, query, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        results = search(**query)
+    return (time.perf_counter() - started) / repeat * 1000, len(results)
+
+
+def run_benchmark(sku_counts, repeat):
+    for skus in sku_counts:
+        products, stock = generate_catalog(skus)
+
+        started = time.perf_counter()
+        engine = CatalogEngine(products, stock)
+        engine.stock_table()
+        build_time = time.perf_counter() - started
+        # Keep the garbage collector from rescanning the (long lived) catalog
+        # objects during the queries, as a loaded server would
+        gc.freeze()
+        print(f"\n{skus:,} SKUs (index build: {build_time:.2f}s)")
+
+        for query in QUERIES:
+            linear_ms, count = time_query(
+                lambda **q: linear_search(products, stock, **q), query, repeat
+            )
+            engine_ms, engine_count = time_query(engine.search, query, repeat)
+            assert count == engine_count
+            print(
+                f"  {str(query):<55} results: {count:>7,}"
+                f"  linear: {linear_ms:>9.2f}ms  indexed: {engine_ms:>9.2f}ms"
+            )
+
+        for text_query in TEXT_QUERIES:
+            # The impact lists of the terms are sorted on their first query
+            engine.text_search(text_query)
+            text_ms, count = time_query(
+                engine.text_search, {"query": text_query}, repeat
+            )
+            print(
+                f"  {repr(text_query):<55} results: {count:>7,}"
+                f"  text search: {text_ms:>9.3f}ms"
+            )
+
+        summary_ms, _ = time_query(
+            lambda: [engine.stock_summary()], {}, repeat
+        )
+        print(f"  {'stock summary':<72}  vectorized: {summary_ms:>9.3f}ms")
+
+        del products, stock, engine
+        gc.unfreeze()
+        gc.collect()
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Product catalog benchmark")
+    parser.add_argument(
+        "--skus",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="Catalog sizes in SKUs (default: 10000 100000 1000000)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of times each query is run (default: 5)",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    run_benchmark(args.skus, args.repeat)
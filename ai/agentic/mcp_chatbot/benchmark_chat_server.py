@@ -0,0 +1,105 @@
+import time
+import asyncio
+import argparse
+import statistics
+from collections import Counter
+import httpx
+
+QUERIES = [
+    "What running shoes do you have?",
+    "Do you have any of them in size 9?",
+    "Which colors are available?",
+]
+
+
+async def run_conversation(client, turns, latencies, statuses):
+    """Run a single shopper conversation and return True if it succeeded."""
+    response = await client.post("/sessions")
+    statuses[response.status_code] += 1
+    if response.status_code != 201:
+        return False
+    session_id = response.json()["session_id"]
+
+    try:
+        for turn in range(turns):
+            started = time.perf_counter()
+            response = await client.post(
+                f"/sessions/{session_id}/messages",
+                json={"query": QUERIES[turn % len(QUERIES)]},
+            )
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+            if response.status_code != 200:
+                return False
+        return True
+    finally:
+        await client.delete(f"/sessions/{session_id}")
+
+
+async def run_benchmark(args):
+    latencies = []
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    timeout = httpx.Timeout(connect=10, read=300, write=20, pool=300)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+
+        async def limited_conversation():
+            async with semaphore:
+                return await run_conversation(
+                    client, args.turns, latencies, statuses
+                )
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(limited_conversation() for _ in range(args.conversations)),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - started
+
+    completed = sum(1 for result in results if result is True)
+    errors = sum(1 for result in results if isinstance(result, Exception))
+    print(f"Conversations: {completed}/{args.conversations} completed")
+    print(f"Client errors: {errors}")
+    print(f"Elapsed: {elapsed:.2f}s")
+    print(f"Conversations/s: {completed / elapsed:.2f}")
+    print(f"Turns/s: {len(latencies) / elapsed:.2f}")
+    if latencies:
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"Turn latency p50: {statistics.median(latencies):.2f}s")
+        print(f"Turn latency p95: {p95:.2f}s")
+    print(f"Status codes: {dict(statuses)}")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Chat server load benchmark")
+    parser.add_argument(
+        "--url",
+        type=str,
+        default="http://127.0.0.1:8080",
+        help="Base URL of the chat server (default: http://127.0.0.1:8080)",
+    )
+    parser.add_argument(
+        "--conversations",
+        type=int,
+        default=50,
+        help="Number of conversations to run (default: 50)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=10,
+        help="Number of conversations running at once (default: 10)",
+    )
+    parser.add_argument(
+        "--turns",
+        type=int,
+        default=3,
+        help="Number of queries per conversation (default: 3)",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark(parse_arguments()))
@@ -0,0 +1,273 @@
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import contextlib
+import uvicorn
+from anthropic import AsyncAnthropicBedrock
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from mcp_chatbot import ChatBot
+from history_manager import HistoryManager
+from mcp_client import MCPClient
+from utils import setup_logger
+
+logger = setup_logger(__name__, level="INFO")
+
+
+class SessionError(Exception):
+    """An error in a session request, with the HTTP status to return."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ChatSession:
+    """A single shopper conversation with its own history."""
+
+    def __init__(self, session_id, chatbot):
+        self.session_id = session_id
+        self.chatbot = chatbot
+        self.lock = asyncio.Lock()
+        self.turns = 0
+        self.last_active = time.monotonic()
+
+
+class SessionStore:
+    """
+    This class keeps the shopper conversations by session id. All sessions
+    share the same MCPClient (and its server sessions) and LLM client, while
+    each one has its own ChatBot holding the conversation history.
+    """
+
+    def __init__(
+        self,
+        mcp_client: MCPClient,
+        max_sessions: int = 1000,
+        max_turns: int = 50,
+        idle_timeout: float = 1800,
+        max_concurrent_queries: int = 64,
+    ):
+        self.mcp_client = mcp_client
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.idle_timeout = idle_timeout
+        self.query_semaphore = asyncio.Semaphore(max_concurrent_queries)
+        self.async_anthropic = AsyncAnthropicBedrock()
+        self.system_message = None
+        self.sessions = {}
+
+    async def load_system_message(self):
+        """Build the shopper system message once, for all the sessions."""
+        chatbot = self._new_chatbot()
+        await chatbot.setup_shopper()
+        self.system_message = chatbot.system_message
+
+    def _new_chatbot(self):
+        return ChatBot(
+            self.mcp_client,
+            parallel_tools=True,
+            stream=True,
+            async_anthropic=self.async_anthropic,
+            history_manager=HistoryManager(),
+            quiet=True,
+        )
+
+    def create(self):
+        """Create a new session and return it."""
+        self.expire_idle()
+        if len(self.sessions) >= self.max_sessions:
+            raise SessionError("Too many active sessions.", 503)
+
+        chatbot = self._new_chatbot()
+        chatbot.system_message = self.system_message
+        session = ChatSession(uuid.uuid4().hex, chatbot)
+        self.sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if not session:
+            raise SessionError(f"Session '{session_id}' not found.", 404)
+        return session
+
+    def delete(self, session_id):
+        self.get(session_id)
+        del self.sessions[session_id]
+
+    def expire_idle(self):
+        """Remove the sessions which have been idle for too long."""
+        now = time.monotonic()
+        expired = [
+            session_id
+            for session_id, session in self.sessions.items()
+            if not session.lock.locked()
+            and now - session.last_active > self.idle_timeout
+        ]
+        for session_id in expired:
+            del self.sessions[session_id]
+        if expired:
+            logger.info("Expired %d idle sessions", len(expired))
+
+    async def process_query(self, session_id, query):
+        """Process a query in a session and return the response text."""
+        session = self.get(session_id)
+        if session.lock.locked():
+            raise SessionError("A query is already running in session.", 409)
+        if session.turns >= self.max_turns:
+            raise SessionError("Maximum number of turns reached.", 429)
+
+        async with session.lock:
+            session.last_active = time.monotonic()
+            # Limit the number of queries (i.e. LLM and tool calls) running
+            # at the same time across all the sessions
+            try:
+                async with self.query_semaphore:
+                    messages = await session.chatbot.process_query(query)
+            except Exception as err:
+                logger.error("Query failed in session %s: %s", session_id, err)
+                raise SessionError("The query could not be processed.", 502)
+            finally:
+                session.last_active = time.monotonic()
+            # Only the successful queries count against the limit of turns
+            session.turns += 1
+            session.chatbot.conversation_history = messages
+
+        return get_response_text(messages)
+
+
+def get_response_text(messages):
+    """Get the text of the last assistant message."""
+    if not messages or messages[-1]["role"] != "assistant":
+        return ""
+    return "".join(
+        content.text
+        for content in messages[-1]["content"]
+        if content.type == "text"
+    )
+
+
+def build_app(args: argparse.Namespace) -> Starlette:
+    mcp_client = MCPClient()
+    store = SessionStore(
+        mcp_client,
+        max_sessions=args.max_sessions,
+        max_turns=args.max_turns,
+        idle_timeout=args.idle_timeout,
+        max_concurrent_queries=args.max_concurrent_queries,
+    )
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        try:
+            await mcp_client.connect_to_servers(args.config, concurrent=True)
+            await store.load_system_message()
+            yield
+        finally:
+            await mcp_client.cleanup()
+
+    async def create_session(request: Request):
+        session = store.create()
+        return JSONResponse({"session_id": session.session_id}, 201)
+
+    async def send_message(request: Request):
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            raise SessionError("Request body must be valid JSON.", 400)
+        if not isinstance(data, dict):
+            raise SessionError("Request body must be a JSON object.", 400)
+        query = str(data.get("query", "")).strip()
+        if not query:
+            raise SessionError("Query must not be empty.", 400)
+
+        session_id = request.path_params["session_id"]
+        response = await store.process_query(session_id, query)
+        return JSONResponse({"session_id": session_id, "response": response})
+
+    async def delete_session(request: Request):
+        store.delete(request.path_params["session_id"])
+        return Response(status_code=204)
+
+    async def get_stats(request: Request):
+        return JSONResponse({"active_sessions": len(store.sessions)})
+
+    async def handle_session_error(request: Request, err: SessionError):
+        return JSONResponse({"error": str(err)}, err.status_code)
+
+    return Starlette(
+        routes=[
+            Route("/sessions", create_session, methods=["POST"]),
+            Route("/sessions", get_stats, methods=["GET"]),
+            Route(
+                "/sessions/{session_id}/messages",
+                send_message,
+                methods=["POST"],
+            ),
+            Route(
+                "/sessions/{session_id}", delete_session, methods=["DELETE"]
+            ),
+        ],
+        exception_handlers={SessionError: handle_session_error},
+        lifespan=lifespan,
+    )
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Multi-session chat server")
+    parser.add_argument(
+        "--config",
+        type=str,
+        default="server_config.json",
+        help="MCP servers config file (default: server_config.json)",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Host to bind the server to (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8080,
+        help="Port to run the server on (default: 8080)",
+    )
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=1000,
+        help="Maximum number of active sessions (default: 1000)",
+    )
+    parser.add_argument(
+        "--max-turns",
+        type=int,
+        default=50,
+        help="Maximum number of queries per session (default: 50)",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=1800,
+        help="Seconds before an idle session expires (default: 1800)",
+    )
+    parser.add_argument(
+        "--max-concurrent-queries",
+        type=int,
+        default=64,
+        help="Maximum number of queries running at once (default: 64)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    uvicorn.run(build_app(args), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
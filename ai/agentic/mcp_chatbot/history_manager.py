@@ -0,0 +1,177 @@
+from utils import setup_logger
+
+logger = setup_logger(__name__, level="INFO")
+
+# Rough number of characters per token, used to estimate the token count
+# without calling the LLM provider.
+CHARS_PER_TOKEN = 4
+
+
+def content_length(content) -> int:
+    """Get the number of characters in message content of any format."""
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, (list, tuple)):
+        return sum(content_length(item) for item in content)
+    if isinstance(content, dict):
+        return sum(content_length(value) for value in content.values())
+    if hasattr(content, "model_dump"):
+        return content_length(content.model_dump(exclude_none=True))
+    return len(str(content))
+
+
+def content_text(content) -> str:
+    """Get the text of tool result content (a string or content items)."""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        item.text if hasattr(item, "text") else str(item) for item in content
+    )
+
+
+def estimate_tokens(messages) -> int:
+    """Estimate the number of tokens in a list of messages."""
+    return content_length(messages) // CHARS_PER_TOKEN
+
+
+def is_tool_result(message) -> bool:
+    """Check if a message carries tool results rather than a user query."""
+    content = message["content"]
+    return isinstance(content, list) and any(
+        isinstance(item, dict) and item.get("type") == "tool_result"
+        for item in content
+    )
+
+
+class HistoryManager:
+    """
+    This class keeps the conversation history within a token budget. When the
+    history is over the budget, the tool results of the older turns are
+    collapsed into short digests first, and then the oldest turns are dropped
+    and replaced by a short summary of the user's earlier queries.
+
+    A turn is a user query together with all the assistant responses and tool
+    results that followed it, so tool_use and tool_result blocks are always
+    kept or dropped together.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 8000,
+        keep_recent_turns: int = 2,
+        digest_chars: int = 200,
+    ):
+        """
+        Args:
+            token_budget: Maximum estimated tokens in the history
+            keep_recent_turns: Number of the latest turns kept as they are
+            digest_chars: Number of characters kept from an old tool result
+        """
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.digest_chars = digest_chars
+        self.last_tokens_saved = 0
+        self.total_tokens_saved = 0
+
+    def compact(self, messages):
+        """Return the messages compacted to the token budget."""
+        self.last_tokens_saved = 0
+        tokens_before = estimate_tokens(messages)
+        if tokens_before <= self.token_budget:
+            return messages
+
+        turns = self._split_turns(messages)
+        old_turns = max(len(turns) - self.keep_recent_turns, 0)
+
+        # Step 1: Collapse the tool results of the old turns
+        for index in range(old_turns):
+            turns[index] = self._collapse_tool_results(turns[index])
+        tokens = estimate_tokens(turns)
+
+        # Step 2: Drop the oldest turns until the history fits the budget
+        dropped_queries = []
+        while old_turns and tokens > self.token_budget:
+            dropped = turns.pop(0)
+            old_turns -= 1
+            tokens -= estimate_tokens(dropped)
+            dropped_queries.append(dropped[0]["content"])
+
+        compacted = [message for turn in turns for message in turn]
+        if dropped_queries:
+            compacted[0] = self._add_summary(compacted[0], dropped_queries)
+
+        self.last_tokens_saved = tokens_before - estimate_tokens(compacted)
+        self.total_tokens_saved += self.last_tokens_saved
+        logger.info(
+            "History compacted: %d -> %d tokens (saved %d)",
+            tokens_before,
+            tokens_before - self.last_tokens_saved,
+            self.last_tokens_saved,
+        )
+        return compacted
+
+    def _split_turns(self, messages):
+        turns = []
+        for message in messages:
+            if not turns or (
+                message["role"] == "user" and not is_tool_result(message)
+            ):
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def _collapse_tool_results(self, turn):
+        """Replace the large tool results of a turn with short digests."""
+        tool_names = {}
+        collapsed = []
+        for message in turn:
+            if message["role"] == "assistant" and isinstance(
+                message["content"], list
+            ):
+                for content in message["content"]:
+                    if getattr(content, "type", None) == "tool_use":
+                        tool_names[content.id] = content.name
+
+            if not is_tool_result(message):
+                collapsed.append(message)
+                continue
+
+            content = []
+            for item in message["content"]:
+                if item.get("type") == "tool_result":
+                    item = dict(
+                        item,
+                        content=self._digest(
+                            tool_names.get(item["tool_use_id"], "tool"),
+                            content_text(item["content"]),
+                        ),
+                    )
+                content.append(item)
+            collapsed.append({"role": message["role"], "content": content})
+        return collapsed
+
+    def _digest(self, tool_name, text):
+        if len(text) <= self.digest_chars:
+            return text
+        omitted = len(text) - self.digest_chars
+        return (
+            f"{text[:self.digest_chars]}... [{tool_name} result truncated,"
+            f" {omitted} characters omitted]"
+        )
+
+    def _add_summary(self, message, dropped_queries):
+        """Prepend a summary of the dropped turns to the first user query."""
+        queries = "; ".join(
+            content_text(query)[: self.digest_chars]
+            for query in dropped_queries
+        )
+        summary = (
+            f"[Earlier in this conversation ({len(dropped_queries)} turns"
+            f" omitted) the user asked: {queries}]"
+        )
+        content = message["content"]
+        if isinstance(content, str):
+            content = f"{summary}\n\n{content}"
+        else:
+            content = [{"type": "text", "text": summary}, *content]
+        return {"role": message["role"], "content": content}
@@ -1,5 +1,15 @@
+import os
 from typing import List
 from mcp.server.fastmcp import FastMCP
+from catalog_engine import (
+    MAX_PAGE_SIZE,
+    CatalogEngine,
+    RenderCache,
+    build_result,
+    paginate_matches,
+    result_fields,
+)
+from catalog_store import SQLiteCatalogStore
 
 
 mcp = FastMCP("product")
@@ -37,6 +47,55 @@ product_catalog = [
 ]
 
 
+product_stock = {
+    "P001": [
+        {"color": "Black", "size": "8", "quantity": 20},
+        {"color": "Black", "size": "9", "quantity": 15},
+        {"color": "White", "size": "8", "quantity": 30},
+        {"color": "White", "size": "9", "quantity": 15},
+        {"color": "Red", "size": "10", "quantity": 20},
+    ],
+    "P002": [
+        {"color": "Black", "size": "8", "quantity": 10},
+        {"color": "Black", "size": "9", "quantity": 5},
+        {"color": "White", "size": "8", "quantity": 20},
+        {"color": "Red", "size": "10", "quantity": 10},
+        {"color": "Green", "size": "10", "quantity": 15},
+    ],
+    "P003": [
+        {"color": "Black", "size": "8", "quantity": 5},
+        {"color": "Black", "size": "9", "quantity": 10},
+        {"color": "White", "size": "9", "quantity": 15},
+        {"color": "Red", "size": "11", "quantity": 5},
+        {"color": "Green", "size": "10", "quantity": 10},
+    ],
+    "P004": [
+        {"color": "Black", "size": "8", "quantity": 8},
+        {"color": "White", "size": "9", "quantity": 12},
+        {"color": "White", "size": "11", "quantity": 18},
+        {"color": "Blue", "size": "10", "quantity": 7},
+        {"color": "Blue", "size": "9", "quantity": 12},
+    ],
+}
+
+# Use the SQLite catalog store if a database is configured (it is seeded with
+# the catalog above when empty), otherwise load the catalog once in memory and
+# index it for the searches
+PRODUCT_DB = os.environ.get("PRODUCT_DB")
+if PRODUCT_DB:
+    catalog = SQLiteCatalogStore(PRODUCT_DB)
+    if catalog.is_empty():
+        catalog.import_catalog(product_catalog, product_stock)
+else:
+    catalog = CatalogEngine(product_catalog, product_stock)
+
+# The rendered markdown of the catalog resources, by category
+render_cache = RenderCache(catalog)
+
+# Maximum number of queries in a search_products_batch call
+MAX_BATCH_QUERIES = 20
+
+
 @mcp.resource("catalog://categories")
 def get_product_categories() -> str:
     """
@@ -47,19 +106,53 @@ def get_product_categories() -> str:
     Returns:
         A markdown formatted string containing all product categories.
     """
+    return render_cache.get("categories", render_categories)
+
+
+def render_categories() -> str:
     # Get all the categories from the product catalog
-    categories = set()
-    for product in product_catalog:
-        categories.add(product["category"])
+    categories = catalog.categories()
 
     # Create markdown content
-    content = "# Available Product Categories\n\n"
+    lines = ["# Available Product Categories\n\n"]
     if categories:
-        for category in sorted(categories):
-            content += f"- {category}\n"
+        lines.extend(f"- {category}\n" for category in categories)
     else:
-        content += "No categories found.\n"
-    return content
+        lines.append("No categories found.\n")
+    return "".join(lines)
+
+
+@mcp.resource("catalog://stock-summary")
+def get_stock_summary_resource() -> str:
+    """
+    This resource provides the total quantity in stock by category, size and
+    color across the whole catalog.
+
+    Args:
+        None
+    Returns:
+        A markdown formatted string containing the stock totals.
+    """
+    return render_cache.get("stock-summary", render_stock_summary)
+
+
+def render_stock_summary() -> str:
+    summary = catalog.stock_summary()
+
+    lines = [
+        "# Stock Summary\n\n",
+        f"Total available: {summary['total_available']}\n",
+    ]
+    for title, key in (
+        ("Category", "by_category"),
+        ("Size", "by_size"),
+        ("Color", "by_color"),
+    ):
+        lines.append(f"\n## By {title}\n")
+        lines.extend(
+            f"- {label}: {total}\n" for label, total in summary[key].items()
+        )
+    return "".join(lines)
 
 
 @mcp.resource("catalog://{category}")
@@ -75,32 +168,48 @@ def get_product_category(category: str) -> str:
     # Normalize category name
     category = category.lower().strip()
 
-    # Filter products by category
-    products = [
-        p for p in product_catalog if p["category"].lower() == category
-    ]
+    content = render_cache.get(
+        ("category", category), lambda: render_category(category)
+    )
+    if content is None:
+        return f"# No products found in category: {category}"
+    return content
 
+
+def render_category(category: str) -> str:
+    # Get the products in the category from the index
+    products = catalog.products_in_category(category)
+
+    # Unknown categories are not cached
     if not products:
-        return f"# No products found in category: {category}"
+        return None
 
     # Create markdown content with product details
-    content = f"# Products in {category.title()} Category\n\n"
-    content += f"Total products: {len(products)}\n\n"
-
+    lines = [
+        f"# Products in {category.title()} Category\n\n",
+        f"Total products: {len(products)}\n\n",
+    ]
     for product in products:
-        content += f"## {product['name']}\n"
-        content += f"- **Product ID**: {product['product_id']}\n"
-        content += f"- **Price**: ${product['price']:.2f}\n"
-        content += f"- **Description**: {product['description']}\n\n"
-        content += "---\n\n"
-
-    return content
+        lines.append(
+            f"## {product['name']}\n"
+            f"- **Product ID**: {product['product_id']}\n"
+            f"- **Price**: ${product['price']:.2f}\n"
+            f"- **Description**: {product['description']}\n\n"
+            "---\n\n"
+        )
+    return "".join(lines)
 
 
 @mcp.tool()
 def search_products(
-    category: str = None, size: str = None, color: str = None
-) -> List[dict]:
+    category: str = None,
+    size: str = None,
+    color: str = None,
+    limit: int = 20,
+    cursor: str = None,
+    fields: List[str] = None,
+    sort_by: str = None,
+) -> dict:
     """
     Search for products based on category, size, and color preferences.
 
@@ -108,87 +217,111 @@ def search_products(
         category: Product category (Lifestyle, Running, Training)
         size: Shoe size
         color: Preferred color
+        limit: Maximum number of products to return (up to 100)
+        cursor: The next_cursor of the previous results, to get the next page
+        fields: Product fields to return (product_id, name, description,
+            category, price, available_options, total_available), all of them
+            if not given
+        sort_by: Sort by price or total_available, prefixed with "-" for
+            descending order (e.g. "-total_available")
     Returns:
-        List of matching products with their details and availability
-    """
-    product_stock = {
-        "P001": [
-            {"color": "Black", "size": "8", "quantity": 20},
-            {"color": "Black", "size": "9", "quantity": 15},
-            {"color": "White", "size": "8", "quantity": 30},
-            {"color": "White", "size": "9", "quantity": 15},
-            {"color": "Red", "size": "10", "quantity": 20},
-        ],
-        "P002": [
-            {"color": "Black", "size": "8", "quantity": 10},
-            {"color": "Black", "size": "9", "quantity": 5},
-            {"color": "White", "size": "8", "quantity": 20},
-            {"color": "Red", "size": "10", "quantity": 10},
-            {"color": "Green", "size": "10", "quantity": 15},
-        ],
-        "P003": [
-            {"color": "Black", "size": "8", "quantity": 5},
-            {"color": "Black", "size": "9", "quantity": 10},
-            {"color": "White", "size": "9", "quantity": 15},
-            {"color": "Red", "size": "11", "quantity": 5},
-            {"color": "Green", "size": "10", "quantity": 10},
-        ],
-        "P004": [
-            {"color": "Black", "size": "8", "quantity": 8},
-            {"color": "White", "size": "9", "quantity": 12},
-            {"color": "White", "size": "11", "quantity": 18},
-            {"color": "Blue", "size": "10", "quantity": 7},
-            {"color": "Blue", "size": "9", "quantity": 12},
-        ],
+        Dictionary with the page of matching products with their details and
+        availability, and the next_cursor (null if there are no more)
+    """
+    matches = catalog.iter_matches(category, size, color)
+    return paginate_matches(matches, limit, cursor, fields, sort_by)
+
+
+@mcp.tool()
+def search_products_batch(
+    queries: List[dict],
+    limit: int = 20,
+    fields: List[str] = None,
+    sort_by: str = None,
+) -> dict:
+    """
+    Search for products with several queries at once, e.g. to compare
+    options. Use it instead of calling search_products several times.
+
+    Args:
+        queries: List of queries (up to 20), each a dictionary with optional
+            category, size and color, e.g. [{"category": "Running",
+            "size": "9"}, {"category": "Training", "color": "Black"}]
+        limit: Maximum number of products to return for each query
+        fields: Product fields to return (as in search_products)
+        sort_by: Sort order of the products of each query (as in
+            search_products)
+    Returns:
+        Dictionary of query (e.g. "category=Running, size=9") to its results,
+        with the matching products and the next_cursor to page through them
+        with search_products
+    """
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise ValueError(f"At most {MAX_BATCH_QUERIES} queries are allowed.")
+
+    # Deduplicate the queries, keyed by their filters
+    filters = {}
+    for query in queries:
+        unknown = set(query) - {"category", "size", "color"}
+        if unknown:
+            raise ValueError(f"Unknown query keys: {', '.join(unknown)}")
+        values = (query.get("category"), query.get("size"), query.get("color"))
+        key = ", ".join(
+            f"{name}={value}"
+            for name, value in zip(("category", "size", "color"), values)
+            if value
+        )
+        filters[key or "all"] = values
+
+    matches = catalog.batch_matches(list(filters.values()))
+    return {
+        key: paginate_matches(query_matches, limit, None, fields, sort_by)
+        for key, query_matches in zip(filters, matches)
     }
 
-    results = []
 
-    # Step 1: Filter products by category first if specified
-    filtered_products = product_catalog
-    if category:
-        filtered_products = [
-            p
-            for p in product_catalog
-            if p["category"].lower() == category.lower()
-        ]
-
-    # Step 2: For each filtered product, check inventory and apply more filters
-    for product in filtered_products:
-        product_id = product["product_id"]
-
-        # Get inventory for this product
-        inventory = product_stock.get(product_id, [])
-
-        # Apply size and color filters to inventory
-        matching_inventory = inventory
-
-        if size:
-            matching_inventory = [
-                item
-                for item in matching_inventory
-                if item["size"] == str(size)
-            ]
-
-        if color:
-            matching_inventory = [
-                item
-                for item in matching_inventory
-                if item["color"].lower() == color.lower()
-            ]
-
-        # Only include products that have matching inventory
-        if matching_inventory:
-            product_result = product.copy()
-            product_result["available_options"] = matching_inventory
-            product_result["total_available"] = sum(
-                item["quantity"] for item in matching_inventory
-            )
-            results.append(product_result)
+@mcp.tool()
+def search_products_text(
+    query: str, limit: int = 10, fields: List[str] = None
+) -> List[dict]:
+    """
+    Search for products with a free text query over their name, description
+    and category, e.g. "lightweight running shoe for marathons". Misspelled
+    words are matched to the closest ones in the catalog.
 
+    Args:
+        query: Free text describing the product
+        limit: Maximum number of products to return (up to 100)
+        fields: Product fields to return (product_id, name, description,
+            category, price, available_options, total_available), all of them
+            if not given
+    Returns:
+        List of the best matching products with their details, availability
+        and relevance score, by descending score
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    fields = result_fields(fields)
+    results = []
+    for match, score in catalog.text_search(query, limit):
+        result = build_result(*match, fields)
+        result["score"] = round(score, 3)
+        results.append(result)
     return results
 
 
+@mcp.tool()
+def get_stock_summary() -> dict:
+    """
+    Get the total quantity in stock by category, size and color across the
+    whole catalog, e.g. to tell which sizes or colors are widely available.
+
+    Returns:
+        Dictionary with the total_available quantity, and the totals
+        by_category, by_size and by_color
+    """
+    return catalog.stock_summary()
+
+
 @mcp.prompt()
 def assistant_instructions(
     additional_context: str = "", brand: str = "Our Shoe Store"
@@ -0,0 +1,177 @@
+import numpy as np
+
+
+class StockTable:
+    """
+    A columnar table of the inventory, with one row per variant (SKU). The
+    product, category, size and color of each row are stored as integer codes
+    in NumPy arrays, so filters are computed as vectorized masks and totals
+    as group-by sums (bincount) instead of Python loops over the variants.
+
+    The rows of a product are contiguous, and the products are in catalog
+    order.
+    """
+
+    def __init__(self, products, stock):
+        """
+        Args:
+            products: Iterable of product dicts (with product_id and category)
+            stock: Dictionary of product_id to the list of its variants
+        """
+        self.products = []
+        self.variants = []
+        # Code to label, and normalized label to code, of each column
+        self.category_labels, self.category_codes = [], {}
+        self.size_labels, self.size_codes = [], {}
+        self.color_labels, self.color_codes = [], {}
+
+        product_column = []
+        category_column = []
+        size_column = []
+        color_column = []
+        quantity_column = []
+        for product in products:
+            product_code = len(self.products)
+            self.products.append(product)
+            category_code = self._code(
+                product["category"],
+                self.category_labels,
+                self.category_codes,
+            )
+            for variant in stock.get(product["product_id"], []):
+                self.variants.append(variant)
+                product_column.append(product_code)
+                category_column.append(category_code)
+                size_column.append(
+                    self._code(
+                        variant["size"], self.size_labels, self.size_codes
+                    )
+                )
+                color_column.append(
+                    self._code(
+                        variant["color"], self.color_labels, self.color_codes
+                    )
+                )
+                quantity_column.append(variant["quantity"])
+
+        self.product = np.array(product_column, dtype=np.int32)
+        self.category = np.array(category_column, dtype=np.int32)
+        self.size = np.array(size_column, dtype=np.int32)
+        self.color = np.array(color_column, dtype=np.int32)
+        self.quantity = np.array(quantity_column, dtype=np.int64)
+
+    @staticmethod
+    def _code(label, labels, codes):
+        """Get the code of a label, adding it to the column's dictionary."""
+        key = str(label).lower()
+        code = codes.get(key)
+        if code is None:
+            code = codes[key] = len(labels)
+            labels.append(str(label))
+        return code
+
+    def update_quantity(self, row, quantity):
+        """Set the quantity of a row, after a change to its stock."""
+        self.quantity[row] = quantity
+        # The variant dicts may be held by callers, so they are replaced
+        self.variants[row] = dict(self.variants[row], quantity=quantity)
+
+    def __len__(self):
+        return len(self.quantity)
+
+    def mask(self, category=None, size=None, color=None, column_masks=None):
+        """
+        Get the boolean mask of the rows matching the filters (case
+        insensitive), or None if no filters are given.
+
+        Args:
+            column_masks: Optional dictionary to reuse the mask of each
+                filter value across several calls (e.g. a batch of queries)
+        """
+        mask = None
+        for name, column, codes, value in (
+            ("category", self.category, self.category_codes, category),
+            ("size", self.size, self.size_codes, size),
+            ("color", self.color, self.color_codes, color),
+        ):
+            if not value:
+                continue
+            code = codes.get(str(value).lower().strip())
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            if column_masks is None:
+                column_mask = column == code
+            else:
+                column_mask = column_masks.get((name, code))
+                if column_mask is None:
+                    column_mask = column_masks[(name, code)] = column == code
+            mask = column_mask if mask is None else mask & column_mask
+        return mask
+
+    def iter_matches(
+        self, category=None, size=None, color=None, column_masks=None
+    ):
+        """
+        Lazily find the products with inventory matching the filters.
+
+        Args:
+            column_masks: Optional dictionary to reuse the filter masks
+                across several searches (see `mask`)
+
+        Yields:
+            Tuples of (product, matching variants, their total quantity)
+        """
+        mask = self.mask(category, size, color, column_masks)
+        rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        if not len(rows):
+            return
+
+        # Split the matching rows into runs of the same product, and sum the
+        # quantity of each run
+        products = self.product[rows]
+        starts = np.flatnonzero(np.diff(products)) + 1
+        starts = np.concatenate(([0], starts))
+        totals = np.add.reduceat(self.quantity[rows], starts)
+        ends = np.append(starts[1:], len(rows))
+
+        rows = rows.tolist()
+        products = products.tolist()
+        variants = self.variants
+        for start, end, total in zip(
+            starts.tolist(), ends.tolist(), totals.tolist()
+        ):
+            yield (
+                self.products[products[start]],
+                [variants[row] for row in rows[start:end]],
+                total,
+            )
+
+    def summary(self):
+        """
+        Get the total quantity in stock by category, size and color, across
+        the whole catalog.
+        """
+        summary = {"total_available": int(self.quantity.sum())}
+        for name, column, labels in (
+            ("by_category", self.category, self.category_labels),
+            ("by_size", self.size, self.size_labels),
+            ("by_color", self.color, self.color_labels),
+        ):
+            totals = np.bincount(
+                column, weights=self.quantity, minlength=len(labels)
+            )
+            summary[name] = {
+                label: int(total)
+                for label, total in sorted(
+                    zip(labels, totals.tolist()), key=label_sort_key
+                )
+            }
+        return summary
+
+
+def label_sort_key(item):
+    """Sort the labels of a summary with the numeric ones (sizes) first."""
+    label = item[0]
+    if label.isdigit():
+        return (0, int(label), label)
+    return (1, 0, label)
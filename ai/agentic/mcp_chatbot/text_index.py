@@ -0,0 +1,257 @@
+import re
+import math
+import heapq
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str):
+    """Split text into lowercase word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def trigrams(term: str):
+    """Get the set of character trigrams of a term, padded at both ends."""
+    padded = f"${term}$"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TextIndex:
+    """
+    A full-text index with BM25 ranking, which is built once and updated
+    incrementally as documents are added and removed.
+
+    Documents have several text fields, weighted by `field_weights`. Query
+    terms which are not in the vocabulary (e.g. misspelled words) are matched
+    to the most similar terms by character trigrams.
+
+    For each term, the BM25 term frequency component of its documents is kept
+    in a list sorted by impact. A query walks these lists in impact order and
+    stops as soon as no other document can make the top results (the
+    threshold algorithm), so most queries only look at the head of the lists.
+    The number of documents scored by a query is also capped, so queries on
+    many common terms stay fast, at the cost of approximate results.
+    """
+
+    def __init__(
+        self,
+        field_weights: dict,
+        k1: float = 1.2,
+        b: float = 0.75,
+        fuzzy_threshold: float = 0.4,
+        max_expansions: int = 3,
+        max_candidates: int = 200,
+    ):
+        """
+        Args:
+            field_weights: Dictionary of field name to its weight
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+            fuzzy_threshold: Minimum trigram similarity of a fuzzy match
+            max_expansions: Maximum number of terms a fuzzy query term matches
+            max_candidates: Maximum number of documents scored by a query,
+                which bounds the query time when many documents have similar
+                scores (the results are then approximate)
+        """
+        self.field_weights = field_weights
+        self.k1 = k1
+        self.b = b
+        self.fuzzy_threshold = fuzzy_threshold
+        self.max_expansions = max_expansions
+        self.max_candidates = max_candidates
+        # term -> {doc_id: weighted term frequency}
+        self.postings = {}
+        # doc_id -> (Counter of weighted term frequencies, document length)
+        self.documents = {}
+        self.total_length = 0
+        # trigram -> set of the terms containing it
+        self.trigram_terms = {}
+        # term -> (impacts by doc_id, list of (impact, doc_id) sorted by
+        # descending impact), computed on first use
+        self.impacts = {}
+        # The average document length the impacts were computed with
+        self.impacts_avg_length = None
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, doc_id, fields: dict):
+        """
+        Add a document (or replace the existing one with the same id).
+
+        Args:
+            doc_id: The document id
+            fields: Dictionary of field name to its text
+        """
+        if doc_id in self.documents:
+            self.remove(doc_id)
+
+        frequencies = Counter()
+        for field, weight in self.field_weights.items():
+            for token in tokenize(fields.get(field) or ""):
+                frequencies[token] += weight
+        length = sum(frequencies.values())
+
+        self.documents[doc_id] = (frequencies, length)
+        self.total_length += length
+        for term, frequency in frequencies.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                for trigram in trigrams(term):
+                    self.trigram_terms.setdefault(trigram, set()).add(term)
+            postings[doc_id] = frequency
+            self.impacts.pop(term, None)
+
+    def remove(self, doc_id):
+        """Remove a document from the index, if it exists."""
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return
+
+        frequencies, length = document
+        self.total_length -= length
+        for term in frequencies:
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+                for trigram in trigrams(term):
+                    terms = self.trigram_terms[trigram]
+                    terms.discard(term)
+                    if not terms:
+                        del self.trigram_terms[trigram]
+            self.impacts.pop(term, None)
+
+    def clear(self):
+        self.postings.clear()
+        self.documents.clear()
+        self.total_length = 0
+        self.trigram_terms.clear()
+        self.impacts.clear()
+
+    def search(self, query: str, limit: int = 10):
+        """
+        Find the documents best matching a query.
+
+        Returns:
+            List of (doc_id, score) tuples, by descending score
+        """
+        weights = self._query_terms(query)
+        if not weights or limit < 1:
+            return []
+
+        # The term frequency impacts depend on the average document length,
+        # so recompute them when it has drifted
+        avg_length = self.total_length / len(self.documents)
+        if (
+            self.impacts_avg_length is None
+            or abs(avg_length - self.impacts_avg_length)
+            > 0.05 * self.impacts_avg_length
+        ):
+            self.impacts.clear()
+            self.impacts_avg_length = avg_length
+
+        lists = []
+        for term, weight in weights.items():
+            df = len(self.postings[term])
+            idf = math.log(1 + (len(self.documents) - df + 0.5) / (df + 0.5))
+            impacts, ordered = self._term_impacts(term)
+            lists.append((weight * idf, impacts, ordered))
+
+        # The weighted impact at the head of each list, the sum of which is an
+        # upper bound of the score of the documents not seen yet. The list
+        # with the largest head is advanced first, which lowers the bound the
+        # fastest.
+        heads = [weight * ordered[0][0] for weight, _, ordered in lists]
+        threshold = sum(heads)
+        queue = [(-head, index, 0) for index, head in enumerate(heads)]
+        heapq.heapify(queue)
+
+        scorers = [(weight, impacts.get) for weight, impacts, _ in lists]
+        top = []
+        seen = set()
+        while queue and len(seen) < self.max_candidates:
+            # No unseen document can score above the current top results
+            if len(top) == limit and top[0][0] >= threshold:
+                break
+
+            _, index, position = heapq.heappop(queue)
+            weight, _, ordered = lists[index]
+            doc_id = ordered[position][1]
+            if position + 1 < len(ordered):
+                head = weight * ordered[position + 1][0]
+                heapq.heappush(queue, (-head, index, position + 1))
+            else:
+                head = 0.0
+            threshold += head - heads[index]
+            heads[index] = head
+
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            score = sum(weight * get(doc_id, 0.0) for weight, get in scorers)
+            entry = (score, doc_id)
+            if len(top) < limit:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+
+        return [(doc_id, score) for score, doc_id in sorted(top, reverse=True)]
+
+    def _query_terms(self, query):
+        """
+        Get the index terms for a query with their weights. A query term
+        which is not in the index is replaced by its fuzzy matches, weighted
+        by their similarity.
+        """
+        weights = {}
+        for token in tokenize(query):
+            if token in self.postings:
+                matches = [(token, 1.0)]
+            else:
+                matches = self.fuzzy_matches(token)
+            for term, similarity in matches:
+                weights[term] = max(weights.get(term, 0.0), similarity)
+        return weights
+
+    def fuzzy_matches(self, token):
+        """
+        Get the index terms most similar to a token, by the Jaccard
+        similarity of their trigrams.
+
+        Returns:
+            List of (term, similarity) tuples, by descending similarity
+        """
+        token_trigrams = trigrams(token)
+        shared = Counter()
+        for trigram in token_trigrams:
+            shared.update(self.trigram_terms.get(trigram, ()))
+
+        matches = []
+        for term, count in shared.items():
+            union = len(token_trigrams) + len(trigrams(term)) - count
+            similarity = count / union
+            if similarity >= self.fuzzy_threshold:
+                matches.append((term, similarity))
+        return heapq.nlargest(
+            self.max_expansions, matches, key=lambda match: match[1]
+        )
+
+    def _term_impacts(self, term):
+        cached = self.impacts.get(term)
+        if cached is None:
+            k1, b = self.k1, self.b
+            avg_length = self.impacts_avg_length
+            impacts = {}
+            for doc_id, frequency in self.postings[term].items():
+                length = self.documents[doc_id][1]
+                norm = k1 * (1 - b + b * length / avg_length)
+                impacts[doc_id] = frequency * (k1 + 1) / (frequency + norm)
+            ordered = sorted(
+                ((impact, doc_id) for doc_id, impact in impacts.items()),
+                reverse=True,
+            )
+            cached = self.impacts[term] = (impacts, ordered)
+        return cached
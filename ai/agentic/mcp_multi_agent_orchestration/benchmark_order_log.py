@@ -0,0 +1,93 @@
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime
+from order_log import OrderIdGenerator, OrderLog
+
+
+async def place_orders(order_log, order_ids, count, client):
+    order_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for index in range(count):
+        await order_log.append(
+            {
+                "order_id": order_ids.new_id(),
+                "product_id": "P001",
+                "quantity": 1,
+                "customer_name": f"Customer {client}",
+                "shipping_address": "1 Main Street",
+                "payment_method": "Credit Card",
+                "order_datetime": order_datetime,
+                "status": "Confirmed",
+                "idempotency_key": f"{client}-{index}",
+            }
+        )
+
+
+async def run_benchmark(batch_size, orders, clients, directory):
+    path = os.path.join(directory, f"orders-{batch_size}.log")
+    order_log = OrderLog(path, batch_size=batch_size)
+    order_ids = OrderIdGenerator()
+    await order_log.open()
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            place_orders(order_log, order_ids, orders // clients, client)
+            for client in range(clients)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    await order_log.close()
+
+    placed = len(order_log.orders)
+    print(
+        f"  batch size {batch_size:>5}: {placed / elapsed:>10,.0f} orders/s"
+        f"  ({order_log.commits:,} fsyncs,"
+        f" {placed / order_log.commits:,.1f} orders per fsync)"
+    )
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Order log benchmark")
+    parser.add_argument(
+        "--orders",
+        type=int,
+        default=10_000,
+        help="Number of orders to place (default: 10000)",
+    )
+    parser.add_argument(
+        "--clients",
+        type=int,
+        default=200,
+        help="Number of clients placing orders at once (default: 200)",
+    )
+    parser.add_argument(
+        "--batch-sizes",
+        type=int,
+        nargs="+",
+        default=[1, 8, 64, 256],
+        help="Maximum orders per fsync to compare (default: 1 8 64 256)",
+    )
+    parser.add_argument(
+        "--dir",
+        type=str,
+        default=None,
+        help="Directory for the order logs (default: a temporary directory)",
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_arguments()
+    print(f"{args.orders:,} orders from {args.clients} concurrent clients")
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for batch_size in args.batch_sizes:
+            await run_benchmark(
+                batch_size, args.orders, args.clients, directory
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
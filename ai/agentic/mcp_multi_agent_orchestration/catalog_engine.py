@@ -0,0 +1,341 @@
+import heapq
+from itertools import islice
+from stock_table import StockTable
+from text_index import TextIndex
+
+# The fields of the search results, and the ones they can be sorted by
+RESULT_FIELDS = (
+    "product_id",
+    "name",
+    "description",
+    "category",
+    "price",
+    "available_options",
+    "total_available",
+)
+SORT_KEYS = {
+    "price": lambda match: match[0]["price"],
+    "total_available": lambda match: match[2],
+}
+MAX_PAGE_SIZE = 100
+# The weights of the product fields in the full-text search
+TEXT_FIELD_WEIGHTS = {"name": 3, "category": 2, "description": 1}
+
+
+def build_result(product, variants, total_available, fields=None):
+    """
+    Build a search result from a product and its matching variants.
+
+    Args:
+        product: The product dict
+        variants: The matching variants of the product
+        total_available: Total quantity of the matching variants
+        fields: The fields to include (all of them if None)
+    """
+    if fields is None:
+        result = product.copy()
+        result["available_options"] = variants
+        result["total_available"] = total_available
+        return result
+
+    values = {
+        "available_options": variants,
+        "total_available": total_available,
+    }
+    return {
+        field: values[field] if field in values else product[field]
+        for field in fields
+    }
+
+
+def result_fields(fields):
+    """
+    Validate the fields requested for the search results, and make sure they
+    include the product_id. Returns None (all the fields) if none are given.
+    """
+    if not fields:
+        return None
+    unknown = [field for field in fields if field not in RESULT_FIELDS]
+    if unknown:
+        raise ValueError(
+            f"Unknown fields: {', '.join(unknown)}. "
+            f"Valid fields are: {', '.join(RESULT_FIELDS)}"
+        )
+    return ["product_id"] + [
+        field for field in fields if field != "product_id"
+    ]
+
+
+def paginate_matches(
+    matches, limit=20, cursor=None, fields=None, sort_by=None
+) -> dict:
+    """
+    Get a page of search results from the (lazy) matches of a catalog search.
+    Only the results in the page are built, and when not sorted, the matches
+    after the page are not even found.
+
+    Args:
+        matches: Iterator of (product, variants, total_available) tuples
+        limit: Maximum number of results in the page
+        cursor: The `next_cursor` of the previous page (None for the first)
+        fields: The fields to include in the results (all of them if None),
+            product_id is always included
+        sort_by: A field in SORT_KEYS, prefixed with "-" for descending
+            order (the catalog order if None)
+
+    Returns:
+        Dict with the `products` in the page and the `next_cursor` to get the
+        next page (None if it is the last one)
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    try:
+        offset = int(cursor) if cursor else 0
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}") from None
+    if offset < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    fields = result_fields(fields)
+
+    # Find one more match than the page, to know if there is a next page
+    end = offset + limit + 1
+    if sort_by:
+        key = SORT_KEYS.get(sort_by.lstrip("-"))
+        if key is None:
+            raise ValueError(
+                f"Invalid sort_by: {sort_by}. "
+                f"Valid values are: {', '.join(SORT_KEYS)}"
+            )
+        select = heapq.nlargest if sort_by.startswith("-") else heapq.nsmallest
+        page = select(end, matches, key=key)[offset:]
+    else:
+        page = list(islice(matches, offset, end))
+
+    return {
+        "products": [build_result(*match, fields) for match in page[:limit]],
+        "next_cursor": str(offset + limit) if len(page) > limit else None,
+    }
+
+
+class RenderCache:
+    """
+    A cache of content rendered from a catalog (such as the markdown of the
+    catalog resources), which is cleared whenever the catalog changes.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.version = catalog.version
+        self.entries = {}
+
+    def get(self, key, render):
+        """
+        Get the rendered content of a key, rendering it on a miss.
+
+        Args:
+            key: The cache key (e.g. the normalized category name)
+            render: Function which renders the content, returning None if
+                it should not be cached
+        """
+        version = self.catalog.version
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+        content = self.entries.get(key)
+        if content is None:
+            content = render()
+            if content is not None:
+                self.entries[key] = content
+        return content
+
+
+class CatalogEngine:
+    """
+    An in-memory product catalog which is loaded once and indexed for the
+    product searches. It keeps an inverted index on category and the total
+    available quantity of each product, and filters the variants by size and
+    color in a columnar (NumPy) table of the stock, so the searches do not
+    loop over the catalog in Python.
+
+    A product's stock is a list of variants (dicts with color, size and
+    quantity), as returned in the `available_options` of the search results.
+    """
+
+    def __init__(self, products=(), stock=None):
+        """
+        Args:
+            products: List of product dicts (with product_id and category)
+            stock: Dictionary of product_id to the list of its variants
+        """
+        self.products = {}
+        self.stock = {}
+        self.totals = {}
+        # Inverted index of category to an ordered set of product ids
+        self.by_category = {}
+        self.category_names = {}
+        self.sorted_categories = None
+        self.text_index = TextIndex(TEXT_FIELD_WEIGHTS)
+        # Columnar table of the stock, rebuilt on first use after a change
+        self._stock_table = None
+        # Incremented on every change, so derived data can be invalidated
+        self.version = 0
+        self.load(products, stock or {})
+
+    def load(self, products, stock):
+        """Add products and their stock to the catalog."""
+        for product in products:
+            self.add_product(product, stock.get(product["product_id"], []))
+
+    def add_product(self, product, variants):
+        """Add a product (or replace the existing one with the same id)."""
+        product_id = product["product_id"]
+        if product_id in self.products:
+            self.remove_product(product_id)
+
+        self.products[product_id] = product
+        self.stock[product_id] = variants
+        self.totals[product_id] = sum(v["quantity"] for v in variants)
+
+        category = product["category"].lower()
+        self.category_names.setdefault(category, product["category"])
+        if category not in self.by_category:
+            self.sorted_categories = None
+        self.by_category.setdefault(category, {})[product_id] = None
+        self.text_index.add(product_id, product)
+        self._stock_table = None
+        self.version += 1
+
+    def remove_product(self, product_id):
+        """Remove a product and its stock from the catalog."""
+        product = self.products.pop(product_id)
+        del self.stock[product_id]
+        del self.totals[product_id]
+
+        category = product["category"].lower()
+        self._remove_posting(self.by_category, category, product_id)
+        if category not in self.by_category:
+            del self.category_names[category]
+            self.sorted_categories = None
+        self.text_index.remove(product_id)
+        self._stock_table = None
+        self.version += 1
+
+    @staticmethod
+    def _remove_posting(index, key, product_id):
+        postings = index.get(key)
+        if postings is not None:
+            postings.pop(product_id, None)
+            if not postings:
+                del index[key]
+
+    def categories(self):
+        """Get the sorted list of the category names."""
+        if self.sorted_categories is None:
+            self.sorted_categories = sorted(self.category_names.values())
+        return self.sorted_categories
+
+    def products_in_category(self, category):
+        """Get the products in a category (case insensitive)."""
+        postings = self.by_category.get(category.lower().strip(), {})
+        return [self.products[product_id] for product_id in postings]
+
+    def iter_matches(self, category=None, size=None, color=None):
+        """
+        Lazily find the products with inventory matching the filters.
+
+        Yields:
+            Tuples of (product, matching variants, their total quantity)
+        """
+        category = category.lower() if category else None
+        color = color.lower() if color else None
+        size = str(size) if size else None
+
+        if category and category not in self.by_category:
+            return
+
+        if not size and not color:
+            # Category only (or no filters), the whole stock matches
+            product_ids = (
+                self.by_category[category] if category else self.products
+            )
+            for product_id in product_ids:
+                if self.stock[product_id]:
+                    yield (
+                        self.products[product_id],
+                        self.stock[product_id],
+                        self.totals[product_id],
+                    )
+            return
+
+        # Filter the variants by size and color with vectorized masks over
+        # the columnar stock table, which also sums the matching quantities
+        # of each product
+        yield from self.stock_table().iter_matches(category, size, color)
+
+    def batch_matches(self, queries):
+        """
+        Find the matches of several searches in one shared pass. The filter
+        masks over the stock table are computed once for each distinct
+        category, size and color across the queries.
+
+        Args:
+            queries: List of (category, size, color) tuples
+
+        Returns:
+            List of the (lazy) iterators of the matches of each query
+        """
+        column_masks = {}
+        table = self.stock_table()
+        return [
+            (
+                self.iter_matches(category)
+                if not size and not color
+                else table.iter_matches(category, size, color, column_masks)
+            )
+            for category, size, color in queries
+        ]
+
+    def stock_table(self):
+        """Get the columnar table of the stock, building it if needed."""
+        if self._stock_table is None:
+            self._stock_table = StockTable(self.products.values(), self.stock)
+        return self._stock_table
+
+    def stock_summary(self):
+        """Get the total quantity in stock by category, size and color."""
+        return self.stock_table().summary()
+
+    def text_search(self, query, limit=10):
+        """
+        Find the products best matching a full-text query, over their name,
+        description and category.
+
+        Returns:
+            List of ((product, variants, total quantity), score) tuples, by
+            descending score
+        """
+        return [
+            (
+                (
+                    self.products[product_id],
+                    self.stock[product_id],
+                    self.totals[product_id],
+                ),
+                score,
+            )
+            for product_id, score in self.text_index.search(query, limit)
+        ]
+
+    def search(self, category=None, size=None, color=None):
+        """
+        Search for the products with inventory matching the filters.
+
+        Returns:
+            List of products with their matching `available_options` and
+            `total_available` quantity
+        """
+        return [
+            build_result(*match)
+            for match in self.iter_matches(category, size, color)
+        ]
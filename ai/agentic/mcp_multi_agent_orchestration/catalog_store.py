@@ -0,0 +1,581 @@
+import csv
+import json
+import sqlite3
+import argparse
+from itertools import groupby
+from catalog_engine import TEXT_FIELD_WEIGHTS, build_result
+from stock_table import StockTable
+from text_index import TextIndex
+from utils import setup_logger
+
+logger = setup_logger(__name__, level="INFO")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    product_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    category TEXT NOT NULL COLLATE NOCASE,
+    price REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS stock (
+    product_id TEXT NOT NULL,
+    size TEXT NOT NULL,
+    color TEXT NOT NULL COLLATE NOCASE,
+    quantity INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    changed_seq INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (product_id, size, color)
+);
+
+CREATE INDEX IF NOT EXISTS idx_products_category
+    ON products (category, product_id);
+
+CREATE INDEX IF NOT EXISTS idx_stock_size_color
+    ON stock (size, color, quantity);
+
+CREATE INDEX IF NOT EXISTS idx_stock_color
+    ON stock (color, quantity);
+"""
+
+# Change counters maintained by triggers, so every connection sharing the
+# database can tell which kind of data changed: the products, the set of the
+# stock rows, or only the quantities (each quantity update stamps its row with
+# the next stock_seq, so the changed rows can be read incrementally)
+CHANGE_TRACKING = """
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO catalog_meta (key, value)
+VALUES ('products_version', 0), ('stock_layout_version', 0), ('stock_seq', 0);
+
+CREATE INDEX IF NOT EXISTS idx_stock_changed_seq ON stock (changed_seq);
+
+CREATE TRIGGER IF NOT EXISTS products_inserted AFTER INSERT ON products
+BEGIN
+    UPDATE catalog_meta SET value = value + 1 WHERE key = 'products_version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_updated AFTER UPDATE ON products
+BEGIN
+    UPDATE catalog_meta SET value = value + 1 WHERE key = 'products_version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_deleted AFTER DELETE ON products
+BEGIN
+    UPDATE catalog_meta SET value = value + 1 WHERE key = 'products_version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS stock_inserted AFTER INSERT ON stock
+BEGIN
+    UPDATE catalog_meta SET value = value + 1
+    WHERE key = 'stock_layout_version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS stock_moved
+AFTER UPDATE OF product_id, size, color ON stock
+BEGIN
+    UPDATE catalog_meta SET value = value + 1
+    WHERE key = 'stock_layout_version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS stock_deleted AFTER DELETE ON stock
+BEGIN
+    UPDATE catalog_meta SET value = value + 1
+    WHERE key = 'stock_layout_version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS stock_quantity_updated
+AFTER UPDATE OF quantity ON stock
+BEGIN
+    UPDATE catalog_meta SET value = value + 1 WHERE key = 'stock_seq';
+    UPDATE stock
+    SET changed_seq = (
+        SELECT value FROM catalog_meta WHERE key = 'stock_seq'
+    )
+    WHERE rowid = NEW.rowid;
+END;
+"""
+
+# The SQL statements are constants, so sqlite3 compiles each of them once and
+# reuses the prepared statement from its per-connection statement cache.
+SELECT_CATEGORIES = "SELECT DISTINCT category FROM products ORDER BY category"
+
+SELECT_CATEGORY_PRODUCTS = """
+SELECT product_id, name, description, category, price
+FROM products
+WHERE category = ?
+ORDER BY rowid
+"""
+
+SELECT_PRODUCTS = """
+SELECT product_id, name, description, category, price
+FROM products
+ORDER BY rowid
+"""
+
+SELECT_ALL_STOCK = """
+SELECT rowid, product_id, color, size, quantity FROM stock ORDER BY rowid
+"""
+
+SELECT_CHANGED_STOCK = """
+SELECT rowid, quantity FROM stock WHERE changed_seq > ?
+"""
+
+SELECT_PRODUCT = """
+SELECT product_id, name, description, category, price
+FROM products
+WHERE product_id = ?
+"""
+
+SELECT_STOCK = """
+SELECT color, size, quantity FROM stock WHERE product_id = ? ORDER BY rowid
+"""
+
+SELECT_MATCHES = """
+SELECT p.product_id, p.name, p.description, p.category, p.price,
+       s.color, s.size, s.quantity
+FROM products AS p
+JOIN stock AS s ON s.product_id = p.product_id
+WHERE {where}
+ORDER BY p.rowid, s.rowid
+"""
+
+UPSERT_PRODUCT = """
+INSERT INTO products (product_id, name, description, category, price)
+VALUES (:product_id, :name, :description, :category, :price)
+ON CONFLICT (product_id) DO UPDATE SET
+    name = excluded.name,
+    description = excluded.description,
+    category = excluded.category,
+    price = excluded.price
+"""
+
+UPSERT_STOCK = """
+INSERT INTO stock (product_id, size, color, quantity)
+VALUES (:product_id, :size, :color, :quantity)
+ON CONFLICT (product_id, size, color) DO UPDATE SET
+    quantity = excluded.quantity,
+    version = version + 1
+"""
+
+SELECT_META = "SELECT value FROM catalog_meta WHERE key = ?"
+
+DELETE_STOCK = "DELETE FROM stock WHERE product_id = ?"
+DELETE_PRODUCT = "DELETE FROM products WHERE product_id = ?"
+
+
+def create_schema(conn):
+    """
+    Create the catalog tables if needed, and add the columns missing in a
+    database made by an older version.
+    """
+    conn.executescript(SCHEMA)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(stock)")}
+    if "version" not in columns:
+        conn.execute(
+            "ALTER TABLE stock ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+        )
+    if "changed_seq" not in columns:
+        conn.execute(
+            "ALTER TABLE stock"
+            " ADD COLUMN changed_seq INTEGER NOT NULL DEFAULT 0"
+        )
+    conn.executescript(CHANGE_TRACKING)
+
+
+class SQLiteCatalogStore:
+    """
+    A persistent product catalog and inventory store in SQLite, with the same
+    search interface as CatalogEngine. The database runs in WAL mode, so
+    several server processes can share it, and readers do not block the
+    writer.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        create_schema(self.conn)
+        self.changes = 0
+        # Statements for each combination of the search filters
+        self._match_statements = {}
+        # The full-text index is kept in memory, and rebuilt when another
+        # connection changes the products (but not on stock changes)
+        self.text_index = TextIndex(TEXT_FIELD_WEIGHTS)
+        self.indexed_products_version = None
+        # The columnar stock table for the aggregations, the versions of the
+        # products and stock rows it was loaded from, the last stock_seq it
+        # has applied, and the table row of each stock rowid
+        self._stock_table = None
+        self._stock_table_layout = None
+        self._stock_table_seq = None
+        self._stock_table_rows = {}
+
+    @property
+    def version(self):
+        """
+        A number which changes whenever the catalog is modified, either by
+        this connection or by another one sharing the database.
+        """
+        return self.changes + self._data_version()
+
+    def _data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _meta(self, key):
+        return self.conn.execute(SELECT_META, (key,)).fetchone()[0]
+
+    def _indexed(self, products_version_before, products_version_after):
+        """
+        Record that the text index was updated with this connection's own
+        changes to the products, unless it was already out of date.
+        """
+        if self.indexed_products_version == products_version_before:
+            self.indexed_products_version = products_version_after
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM products").fetchone() is None
+
+    def import_catalog(self, products, stock):
+        """
+        Import (insert or update) products and their stock in a single
+        transaction.
+
+        Args:
+            products: List of product dicts
+            stock: Dictionary of product_id to the list of its variants
+        """
+        with self._transaction():
+            before = self._meta("products_version")
+            self.conn.executemany(UPSERT_PRODUCT, products)
+            self.conn.executemany(
+                UPSERT_STOCK,
+                (
+                    {"product_id": product_id, **variant}
+                    for product_id, variants in stock.items()
+                    for variant in variants
+                ),
+            )
+            after = self._meta("products_version")
+        for product in products:
+            self.text_index.add(product["product_id"], product)
+        self._indexed(before, after)
+
+    def add_product(self, product, variants):
+        """Add a product (or replace the existing one with the same id)."""
+        with self._transaction():
+            before = self._meta("products_version")
+            self.conn.execute(UPSERT_PRODUCT, product)
+            self.conn.execute(DELETE_STOCK, (product["product_id"],))
+            self.conn.executemany(
+                UPSERT_STOCK,
+                (
+                    {"product_id": product["product_id"], **variant}
+                    for variant in variants
+                ),
+            )
+            after = self._meta("products_version")
+        self.text_index.add(product["product_id"], product)
+        self._indexed(before, after)
+
+    def remove_product(self, product_id):
+        """Remove a product and its stock from the catalog."""
+        with self._transaction():
+            before = self._meta("products_version")
+            self.conn.execute(DELETE_STOCK, (product_id,))
+            self.conn.execute(DELETE_PRODUCT, (product_id,))
+            after = self._meta("products_version")
+        self.text_index.remove(product_id)
+        self._indexed(before, after)
+
+    def _transaction(self):
+        self.changes += 1
+        return Transaction(self.conn)
+
+    def categories(self):
+        """Get the sorted list of the category names."""
+        return [row[0] for row in self.conn.execute(SELECT_CATEGORIES)]
+
+    def products_in_category(self, category):
+        """Get the products in a category (case insensitive)."""
+        cursor = self.conn.execute(
+            SELECT_CATEGORY_PRODUCTS, (category.strip(),)
+        )
+        return [self._product(row) for row in cursor]
+
+    def get_stock(self, product_id):
+        """Get the list of variants in stock for a product."""
+        cursor = self.conn.execute(SELECT_STOCK, (product_id,))
+        return [
+            {"color": color, "size": size, "quantity": quantity}
+            for color, size, quantity in cursor
+        ]
+
+    def iter_matches(self, category=None, size=None, color=None):
+        """
+        Lazily find the products with inventory matching the filters. The
+        rows are fetched from the cursor as the results are consumed.
+
+        Yields:
+            Tuples of (product, matching variants, their total quantity)
+        """
+        filters = {"category": category, "size": size, "color": color}
+        params = {name: str(value) for name, value in filters.items() if value}
+        cursor = self.conn.execute(
+            self._match_statement(tuple(params)), params
+        )
+
+        for _, rows in groupby(cursor, key=lambda row: row[0]):
+            rows = list(rows)
+            variants = [
+                {"color": row[5], "size": row[6], "quantity": row[7]}
+                for row in rows
+            ]
+            yield (
+                self._product(rows[0]),
+                variants,
+                sum(v["quantity"] for v in variants),
+            )
+
+    def _match_statement(self, filter_names):
+        statement = self._match_statements.get(filter_names)
+        if statement is None:
+            columns = {"category": "p.category", "size": "s.size"}
+            where = " AND ".join(
+                f"{columns.get(name, 's.' + name)} = :{name}"
+                for name in filter_names
+            )
+            statement = SELECT_MATCHES.format(where=where or "1")
+            self._match_statements[filter_names] = statement
+        return statement
+
+    def text_search(self, query, limit=10):
+        """
+        Find the products best matching a full-text query, over their name,
+        description and category.
+
+        Returns:
+            List of ((product, variants, total quantity), score) tuples, by
+            descending score
+        """
+        # Only the changes to the products need the index to be rebuilt,
+        # not the stock updates (e.g. the reservations of the orders)
+        products_version = self._meta("products_version")
+        if products_version != self.indexed_products_version:
+            self.text_index.clear()
+            for row in self.conn.execute(SELECT_PRODUCTS):
+                self.text_index.add(row[0], self._product(row))
+            self.indexed_products_version = products_version
+
+        results = []
+        for product_id, score in self.text_index.search(query, limit):
+            row = self.conn.execute(SELECT_PRODUCT, (product_id,)).fetchone()
+            variants = self.get_stock(product_id)
+            total = sum(v["quantity"] for v in variants)
+            results.append(((self._product(row), variants, total), score))
+        return results
+
+    def stock_table(self):
+        """
+        Get the columnar table of the stock. It is loaded again from the
+        database only when the products or the set of the stock rows have
+        changed, and the quantity updates (e.g. the reservations of the
+        orders) are applied to it row by row.
+        """
+        # Read the counters and the changes in the same snapshot
+        with Transaction(self.conn, "DEFERRED"):
+            layout = (
+                self._meta("products_version"),
+                self._meta("stock_layout_version"),
+            )
+            seq = self._meta("stock_seq")
+            if self._stock_table is None or self._stock_table_layout != layout:
+                self._load_stock_table()
+                self._stock_table_layout = layout
+            elif seq != self._stock_table_seq:
+                for rowid, quantity in self.conn.execute(
+                    SELECT_CHANGED_STOCK, (self._stock_table_seq,)
+                ):
+                    row = self._stock_table_rows.get(rowid)
+                    if row is not None:
+                        self._stock_table.update_quantity(row, quantity)
+            self._stock_table_seq = seq
+        return self._stock_table
+
+    def _load_stock_table(self):
+        stock = {}
+        rowids = {}
+        for rowid, product_id, color, size, quantity in self.conn.execute(
+            SELECT_ALL_STOCK
+        ):
+            stock.setdefault(product_id, []).append(
+                {"color": color, "size": size, "quantity": quantity}
+            )
+            rowids.setdefault(product_id, []).append(rowid)
+        products = [
+            self._product(row) for row in self.conn.execute(SELECT_PRODUCTS)
+        ]
+        self._stock_table = StockTable(products, stock)
+
+        # The rows of the table are in product order, then in stock order
+        self._stock_table_rows = {}
+        for product in products:
+            for rowid in rowids.get(product["product_id"], []):
+                self._stock_table_rows[rowid] = len(self._stock_table_rows)
+
+    def batch_matches(self, queries):
+        """
+        Find the matches of several searches in one shared pass, over the
+        stock table loaded once, with the filter masks computed once for each
+        distinct category, size and color across the queries.
+
+        Args:
+            queries: List of (category, size, color) tuples
+
+        Returns:
+            List of the (lazy) iterators of the matches of each query
+        """
+        column_masks = {}
+        table = self.stock_table()
+        return [
+            table.iter_matches(category, size, color, column_masks)
+            for category, size, color in queries
+        ]
+
+    def stock_summary(self):
+        """Get the total quantity in stock by category, size and color."""
+        return self.stock_table().summary()
+
+    def search(self, category=None, size=None, color=None):
+        """
+        Search for the products with inventory matching the filters.
+
+        Returns:
+            List of products with their matching `available_options` and
+            `total_available` quantity
+        """
+        return [
+            build_result(*match)
+            for match in self.iter_matches(category, size, color)
+        ]
+
+    @staticmethod
+    def _product(row):
+        return {
+            "product_id": row[0],
+            "name": row[1],
+            "description": row[2],
+            "category": row[3],
+            "price": row[4],
+        }
+
+    def close(self):
+        self.conn.close()
+
+
+class Transaction:
+    """Run the statements of a `with` block in a single transaction."""
+
+    def __init__(self, conn, mode="IMMEDIATE"):
+        """
+        Args:
+            conn: Connection in autocommit mode
+            mode: "IMMEDIATE" to take the write lock at once, or "DEFERRED"
+                for a read-only snapshot
+        """
+        self.conn = conn
+        self.mode = mode
+
+    def __enter__(self):
+        self.conn.execute(f"BEGIN {self.mode}")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def load_catalog_file(path):
+    """
+    Load a catalog file for the bulk import.
+
+    A JSON file contains {"products": [...], "stock": {product_id: [...]}}.
+    A CSV file has one row per SKU with the columns product_id, name,
+    description, category, price, size, color and quantity.
+
+    Returns:
+        Tuple of (products, stock)
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        return data["products"], data.get("stock", {})
+
+    products = {}
+    stock = {}
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        for row in csv.DictReader(file):
+            product_id = row["product_id"]
+            products.setdefault(
+                product_id,
+                {
+                    "product_id": product_id,
+                    "name": row["name"],
+                    "description": row["description"],
+                    "category": row["category"],
+                    "price": float(row["price"]),
+                },
+            )
+            stock.setdefault(product_id, []).append(
+                {
+                    "color": row["color"],
+                    "size": row["size"],
+                    "quantity": int(row["quantity"]),
+                }
+            )
+    return list(products.values()), stock
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Bulk import a catalog into the SQLite catalog store"
+    )
+    parser.add_argument(
+        "catalog_file", type=str, help="Catalog file to import (JSON or CSV)"
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        default="products.db",
+        help="Path to the SQLite database (default: products.db)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    products, stock = load_catalog_file(args.catalog_file)
+
+    store = SQLiteCatalogStore(args.db)
+    try:
+        store.import_catalog(products, stock)
+    finally:
+        store.close()
+
+    skus = sum(len(variants) for variants in stock.values())
+    logger.info(
+        "Imported %d products and %d SKUs into %s",
+        len(products),
+        skus,
+        args.db,
+    )
+
+
+if __name__ == "__main__":
+    main()
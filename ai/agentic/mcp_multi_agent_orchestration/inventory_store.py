@@ -0,0 +1,256 @@
+import time
+import sqlite3
+from catalog_store import Transaction, create_schema
+from utils import setup_logger
+
+logger = setup_logger(__name__, level="INFO")
+
+RESERVATIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reservations (
+    reservation_id TEXT PRIMARY KEY,
+    product_id TEXT NOT NULL,
+    size TEXT NOT NULL,
+    color TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_reservations_status
+    ON reservations (status, created_at);
+"""
+
+SELECT_SKU = """
+SELECT quantity, version FROM stock
+WHERE product_id = ? AND size = ? AND color = ?
+"""
+
+# Only succeeds if the SKU was not changed since it was read
+DECREMENT_SKU = """
+UPDATE stock SET quantity = quantity - ?, version = version + 1
+WHERE product_id = ? AND size = ? AND color = ? AND version = ?
+    AND quantity >= ?
+"""
+
+INCREMENT_SKU = """
+UPDATE stock SET quantity = quantity + ?, version = version + 1
+WHERE product_id = ? AND size = ? AND color = ?
+"""
+
+INSERT_RESERVATION = """
+INSERT INTO reservations
+    (reservation_id, product_id, size, color, quantity, status, created_at)
+VALUES (?, ?, ?, ?, ?, 'reserved', ?)
+"""
+
+SELECT_RESERVATION = """
+SELECT product_id, size, color, quantity, status FROM reservations
+WHERE reservation_id = ?
+"""
+
+SELECT_EXPIRED_RESERVATIONS = """
+SELECT reservation_id FROM reservations
+WHERE status = 'reserved' AND created_at < ?
+"""
+
+UPDATE_RESERVATION_STATUS = """
+UPDATE reservations SET status = ? WHERE reservation_id = ? AND status = ?
+"""
+
+
+class InventoryError(Exception):
+    """An inventory operation which cannot be done (e.g. out of stock)."""
+
+
+class InventoryStore:
+    """
+    The inventory shared by the product and order servers, in the SQLite
+    database of the catalog store. Stock is reserved for an order before it
+    is placed, and the reservation is then committed, or released if the
+    order fails, so concurrent orders (from any process) never oversell.
+
+    The reservations use optimistic concurrency: the SKU's quantity and
+    version are read without a lock, and the quantity is decremented only if
+    the version has not changed meanwhile, otherwise the reservation is
+    retried.
+    """
+
+    def __init__(self, db_path: str, max_retries: int = 10):
+        self.db_path = db_path
+        self.max_retries = max_retries
+        self.conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        create_schema(self.conn)
+        self.conn.executescript(RESERVATIONS_SCHEMA)
+        self.conflicts = 0
+
+    def get_quantity(self, product_id, size, color):
+        """Get the quantity in stock of a SKU, or None if it is not found."""
+        row = self.conn.execute(
+            SELECT_SKU, (product_id, str(size), color)
+        ).fetchone()
+        return row[0] if row else None
+
+    def reserve(self, reservation_id, product_id, size, color, quantity):
+        """
+        Atomically reserve (decrement) the stock of a SKU.
+
+        Raises:
+            InventoryError: If the SKU is not found or has not enough stock,
+                or the reservation kept conflicting with other updates
+        """
+        if quantity < 1:
+            raise InventoryError("Quantity must be at least 1.")
+        sku = (product_id, str(size), color)
+
+        for _ in range(self.max_retries):
+            row = self.conn.execute(SELECT_SKU, sku).fetchone()
+            if row is None:
+                raise InventoryError(
+                    f"Product {product_id} is not available in size {size}"
+                    f" and color {color}."
+                )
+            available, version = row
+            if available < quantity:
+                raise InventoryError(
+                    f"Only {available} of product {product_id} left in"
+                    f" size {size} and color {color}."
+                )
+
+            with Transaction(self.conn):
+                updated = self.conn.execute(
+                    DECREMENT_SKU, (quantity, *sku, version, quantity)
+                ).rowcount
+                if updated:
+                    self.conn.execute(
+                        INSERT_RESERVATION,
+                        (reservation_id, *sku, quantity, time.time()),
+                    )
+                    return
+
+            # The SKU was changed since it was read, so try again
+            self.conflicts += 1
+
+        raise InventoryError(
+            f"Could not reserve product {product_id}, please try again."
+        )
+
+    def reserve_many(self, reservations):
+        """
+        Atomically reserve the stock of several SKUs, all or nothing. Unlike
+        `reserve`, the whole batch is done in one write transaction, which
+        locks the database, so no retries are needed.
+
+        Args:
+            reservations: List of (reservation_id, product_id, size, color,
+                quantity) tuples
+
+        Raises:
+            InventoryError: If any SKU is not found or has not enough stock
+                for the total quantity reserved from it
+        """
+        requested = {}
+        for _, product_id, size, color, quantity in reservations:
+            if quantity < 1:
+                raise InventoryError("Quantity must be at least 1.")
+            sku = (product_id, str(size), color)
+            requested[sku] = requested.get(sku, 0) + quantity
+
+        now = time.time()
+        with Transaction(self.conn):
+            for sku, quantity in requested.items():
+                row = self.conn.execute(SELECT_SKU, sku).fetchone()
+                product_id, size, color = sku
+                if row is None:
+                    raise InventoryError(
+                        f"Product {product_id} is not available in size"
+                        f" {size} and color {color}."
+                    )
+                if row[0] < quantity:
+                    raise InventoryError(
+                        f"Only {row[0]} of product {product_id} left in"
+                        f" size {size} and color {color}."
+                    )
+                self.conn.execute(
+                    DECREMENT_SKU, (quantity, *sku, row[1], quantity)
+                )
+            self.conn.executemany(
+                INSERT_RESERVATION,
+                [
+                    (reservation_id, product_id, str(size), color, qty, now)
+                    for reservation_id, product_id, size, color, qty in (
+                        reservations
+                    )
+                ],
+            )
+
+    def commit(self, reservation_id):
+        """Commit a reservation, once its order is placed."""
+        self.commit_many([reservation_id])
+
+    def commit_many(self, reservation_ids):
+        """Commit several reservations in one transaction."""
+        with Transaction(self.conn):
+            for reservation_id in reservation_ids:
+                updated = self.conn.execute(
+                    UPDATE_RESERVATION_STATUS,
+                    ("committed", reservation_id, "reserved"),
+                ).rowcount
+                if not updated:
+                    raise InventoryError(
+                        f"No reservation {reservation_id} to commit."
+                    )
+
+    def release(self, reservation_id):
+        """Release a reservation, returning its quantity to the stock."""
+        self.release_many([reservation_id])
+
+    def release_many(self, reservation_ids):
+        """Release several reservations in one transaction."""
+        self._return_stock(reservation_ids, "reserved", "released")
+
+    def cancel(self, reservation_id):
+        """
+        Cancel a committed reservation (e.g. when its order fails after it
+        was accepted), returning its quantity to the stock.
+        """
+        self._return_stock([reservation_id], "committed", "cancelled")
+
+    def _return_stock(self, reservation_ids, from_status, to_status):
+        with Transaction(self.conn):
+            for reservation_id in reservation_ids:
+                row = self.conn.execute(
+                    SELECT_RESERVATION, (reservation_id,)
+                ).fetchone()
+                if row is None or row[4] != from_status:
+                    continue
+                product_id, size, color, quantity, _ = row
+                self.conn.execute(
+                    INCREMENT_SKU, (quantity, product_id, size, color)
+                )
+                self.conn.execute(
+                    UPDATE_RESERVATION_STATUS,
+                    (to_status, reservation_id, from_status),
+                )
+
+    def release_expired(self, max_age: float):
+        """
+        Release the reservations older than `max_age` seconds which were
+        neither committed nor released (e.g. after a crash).
+        """
+        expired = [
+            row[0]
+            for row in self.conn.execute(
+                SELECT_EXPIRED_RESERVATIONS, (time.time() - max_age,)
+            )
+        ]
+        for reservation_id in expired:
+            self.release(reservation_id)
+        if expired:
+            logger.info("Released %d expired reservations", len(expired))
+
+    def close(self):
+        self.conn.close()
@@ -1,6 +1,8 @@
+import time
 import asyncio
-from anthropic import AnthropicBedrock
+from anthropic import AnthropicBedrock, AsyncAnthropicBedrock
 from mcp_client import MCPClient
+from history_manager import HistoryManager
 from utils import setup_logger, cprint
 
 logger = setup_logger(__name__, level="INFO")
@@ -12,9 +14,22 @@ class ChatBot:
     Anthropic API and Amazon Bedrock.
     """
 
-    def __init__(self, mcp_client: MCPClient):
+    def __init__(
+        self,
+        mcp_client: MCPClient,
+        cache_tools: bool = False,
+        parallel_tools: bool = False,
+        stream: bool = False,
+        async_anthropic: AsyncAnthropicBedrock | None = None,
+        history_manager: HistoryManager | None = None,
+    ):
         self.anthropic = AnthropicBedrock()
+        self.async_anthropic = async_anthropic or AsyncAnthropicBedrock()
         self.mcp_client = mcp_client
+        self.cache_tools = cache_tools
+        self.parallel_tools = parallel_tools
+        self.stream = stream
+        self.history_manager = history_manager
         self.conversation_history = []
         self.system_message = None
 
@@ -105,18 +120,21 @@ class ChatBot:
     def list_resources(self):
         """List all available resources."""
 
-        if not self.mcp_client.available_resources:
+        resources = self.mcp_client.available_resources
+        templates = self.mcp_client.available_resource_templates
+        if not resources and not templates:
             print("No resources available.")
             return
 
         print("\nAvailable Resources:")
-        for server in set(
-            r["server_name"] for r in self.mcp_client.available_resources
-        ):
+        for server in set(r["server_name"] for r in resources + templates):
             print(f"\nServer '{server}':")
-            for resource in self.mcp_client.available_resources:
+            for resource in resources:
                 if resource["server_name"] == server:
                     print(f"- {resource['uri']} - {resource['name']}")
+            for template in templates:
+                if template["server_name"] == server:
+                    print(f"- {template['uri_template']} - {template['name']}")
 
     def list_tools(self):
         """List all available tools."""
@@ -169,6 +187,31 @@ class ChatBot:
                 f" Prompts: {prompt_count}, Resources: {resource_count})"
             )
 
+    def manage_cache(self, command_parts):
+        """Show the tool and resource cache statistics, or flush them."""
+        tool_cache = self.mcp_client.tool_cache
+        resource_cache = self.mcp_client.resource_cache
+        if len(command_parts) > 1 and command_parts[1] == "flush":
+            tool_cache.clear()
+            resource_cache.clear()
+            print("Tool and resource caches flushed.")
+            return
+
+        print("\nTool Cache:")
+        for name, value in tool_cache.stats().items():
+            print(f"- {name}: {value}")
+        print("Cacheable tools (TTL in seconds):")
+        for tool_name, ttl in self.mcp_client.tool_cache_ttls.items():
+            print(f"- {tool_name}: {ttl}")
+
+        print("\nResource Cache:")
+        for name, value in resource_cache.stats().items():
+            print(f"- {name}: {value}")
+        print(f"- revalidations: {self.mcp_client.resource_revalidations}")
+        print("Cacheable servers (TTL in seconds):")
+        for server_name, ttl in self.mcp_client.resource_cache_ttls.items():
+            print(f"- {server_name}: {ttl}")
+
     async def get_prompt(self, command_parts):
         """Print a prompt with the given command parts."""
         try:
@@ -209,30 +252,131 @@ class ChatBot:
         except Exception as err:
             logger.error("Error fetching resource '%s': %s", resource_uri, err)
 
+    async def _execute_tool_uses(self, tool_uses):
+        """
+        Execute the tool_use blocks of a response concurrently and return a
+        single user message with all of their tool_result blocks.
+        """
+        results = await self.mcp_client.execute_tools(
+            [(tool_use.name, tool_use.input) for tool_use in tool_uses]
+        )
+        return self._tool_results_message(tool_uses, results)
+
+    def _tool_results_message(self, tool_uses, results):
+        """Create a user message with the results of the tool_use blocks."""
+        tool_results = []
+        for tool_use, result in zip(tool_uses, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    "Error executing tool '%s': %s", tool_use.name, result
+                )
+                tool_results.append(
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": tool_use.id,
+                        "content": str(result),
+                        "is_error": True,
+                    }
+                )
+            else:
+                cprint(f"Tool result: {result}", color="blue")
+                tool_results.append(
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": tool_use.id,
+                        "content": result.content,
+                    }
+                )
+        return {"role": "user", "content": tool_results}
+
+    async def _stream_response(self, **request):
+        """
+        Stream a response from the LLM. The text is printed as it arrives, and
+        each tool starts running as soon as its tool_use block (including the
+        input JSON) is complete, while the rest of the response is streamed.
+
+        Returns:
+            The final message, and a list of (tool_use, task) for the tools
+        """
+        tool_calls = []
+        started = time.perf_counter()
+        first_token = True
+        try:
+            async with self.async_anthropic.messages.stream(
+                **request
+            ) as stream:
+                async for event in stream:
+                    if event.type == "text":
+                        if first_token:
+                            first_token = False
+                            logger.debug(
+                                "Time to first token: %.2fs",
+                                time.perf_counter() - started,
+                            )
+                        print(event.text, end="", flush=True)
+                    elif event.type == "content_block_stop":
+                        block = event.content_block
+                        if block.type == "text":
+                            print()
+                        elif block.type == "tool_use":
+                            task = asyncio.create_task(
+                                self.mcp_client.execute_tool(
+                                    block.name, block.input
+                                )
+                            )
+                            tool_calls.append((block, task))
+                response = await stream.get_final_message()
+        except BaseException:
+            for _, task in tool_calls:
+                task.cancel()
+            raise
+        return response, tool_calls
+
     async def process_query(self, query):
         messages = []
 
-        # Add conversation history
-        messages.extend(self.conversation_history)
+        # Add conversation history, compacted to the token budget if needed
+        history = self.conversation_history
+        if self.history_manager:
+            history = self.history_manager.compact(history)
+        messages.extend(history)
 
         # Add current query
         messages.append({"role": "user", "content": query})
 
-        # Create clean tools list for Anthropic API (without any additional or
-        # non-serializable data)
-        tools_for_anthropic = []
-        for tool in self.mcp_client.available_tools:
-            tools_for_anthropic.append(
-                {
-                    "name": tool["name"],
-                    "description": tool["description"],
-                    "input_schema": tool["input_schema"],
-                }
-            )
+        # Tools list for Anthropic API, cached by the client until the
+        # available tools change
+        tools_for_anthropic = self.mcp_client.get_tools_payload(
+            cache_control=self.cache_tools
+        )
 
         while True:
             model = "us.anthropic.claude-3-7-sonnet-20250219-v1:0"
             max_tokens = 2048
+
+            if self.stream:
+                response, tool_calls = await self._stream_response(
+                    model=model,
+                    max_tokens=max_tokens,
+                    tools=tools_for_anthropic,
+                    system=self.system_message,
+                    messages=messages,
+                )
+                messages.append(
+                    {"role": "assistant", "content": response.content}
+                )
+                if not tool_calls:
+                    break
+                results = await asyncio.gather(
+                    *(task for _, task in tool_calls), return_exceptions=True
+                )
+                messages.append(
+                    self._tool_results_message(
+                        [tool_use for tool_use, _ in tool_calls], results
+                    )
+                )
+                continue
+
             response = self.anthropic.messages.create(
                 model=model,
                 max_tokens=max_tokens,
@@ -241,6 +385,24 @@ class ChatBot:
                 messages=messages,
             )
 
+            if self.parallel_tools:
+                # Run all the tools requested in this response at once
+                for content in response.content:
+                    if content.type == "text":
+                        print(content.text)
+                messages.append(
+                    {"role": "assistant", "content": response.content}
+                )
+                tool_uses = [
+                    content
+                    for content in response.content
+                    if content.type == "tool_use"
+                ]
+                if not tool_uses:
+                    break
+                messages.append(await self._execute_tool_uses(tool_uses))
+                continue
+
             assistant_content = []
             has_tool_use = False
 
@@ -295,6 +457,7 @@ class ChatBot:
         print("Use /prompts to list available prompts")
         print("Use /prompt <name> <arg1=value1> to print a prompt")
         print("Use @protocol://resource to see resource content")
+        print("Use /cache to see cache stats, /cache flush to flush caches")
         print("Type your queries or '/exit' to exit.")
 
         while True:
@@ -326,6 +489,8 @@ class ChatBot:
                         await self.get_prompt(parts)
                     elif command == "/tool":
                         await self.execute_tool(parts)
+                    elif command == "/cache":
+                        self.manage_cache(parts)
                     else:
                         self._handle_common_commands(command)
                     continue
@@ -341,10 +506,8 @@ class ChatBot:
             except Exception as err:
                 logger.error("Error processing query: %s", err)
 
-    async def shopper_bot(self):
-        self._print_common_commands()
-        print("\nHow can I help you today?")
-
+    async def setup_shopper(self):
+        """Set the system message for the shopper mode."""
         categories = await self.mcp_client.get_resource("catalog://categories")
         shipping_info = await self.mcp_client.get_resource("info://shipping")
 
@@ -383,6 +546,12 @@ SHIPPING INFORMATION:
         domain_instructions += f"\n\n{additional_context}"
         self.system_message = domain_instructions
 
+    async def shopper_bot(self):
+        self._print_common_commands()
+        print("\nHow can I help you today?")
+
+        await self.setup_shopper()
+
         while True:
             try:
                 query = input("\nQuery: ").strip()
@@ -408,9 +577,16 @@ SHIPPING INFORMATION:
 
 async def main():
     mcp_client = MCPClient()
-    chatbot = ChatBot(mcp_client)
+    chatbot = ChatBot(
+        mcp_client,
+        parallel_tools=True,
+        stream=True,
+        history_manager=HistoryManager(),
+    )
     try:
-        await mcp_client.connect_to_servers("server_config.json")
+        await mcp_client.connect_to_servers(
+            "server_config.json", concurrent=True
+        )
         mode = input("Enter chat mode (admin/shopper): ").strip().lower()
         if mode == "admin":
             await chatbot.admin_bot()
@@ -1,12 +1,62 @@
 import json
+import time
+import asyncio
+from functools import partial
 from contextlib import AsyncExitStack
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
+from cache import TTLCache
 from utils import setup_logger
 
 logger = setup_logger(__name__, level="INFO")
 
 
+class ResourceRouter:
+    """
+    Routes resource URIs to the servers which provide them. Static resource
+    URIs are matched exactly, and resource templates (e.g.
+    `catalog://{category}`) and protocols (e.g. `catalog://`) are matched on
+    their longest literal prefix.
+    """
+
+    def __init__(self):
+        self.uris = {}
+        self.prefixes = {}
+        # Distinct prefix lengths (longest first), so a lookup only probes
+        # one dictionary key per length instead of scanning all prefixes.
+        self.prefix_lengths = []
+
+    def add_uri(self, uri, server_name):
+        self.uris.setdefault(uri, server_name)
+
+    def add_prefix(self, prefix, server_name):
+        self.prefixes.setdefault(prefix, server_name)
+        if len(prefix) not in self.prefix_lengths:
+            self.prefix_lengths.append(len(prefix))
+            self.prefix_lengths.sort(reverse=True)
+
+    def add_template(self, uri_template, server_name):
+        """Add a template by the literal part before its first parameter."""
+        self.add_prefix(uri_template.split("{", maxsplit=1)[0], server_name)
+
+    def route(self, uri):
+        """Return the name of the server for the URI, or None."""
+        server_name = self.uris.get(uri)
+        if server_name:
+            return server_name
+
+        for length in self.prefix_lengths:
+            server_name = self.prefixes.get(uri[:length])
+            if server_name:
+                return server_name
+        return None
+
+    def clear(self):
+        self.uris.clear()
+        self.prefixes.clear()
+        self.prefix_lengths.clear()
+
+
 class MCPClient:
     """
     This class manages connections to MCP servers (separate sessions for each
@@ -17,90 +67,372 @@ class MCPClient:
     def __init__(self):
         self.exit_stack = AsyncExitStack()
         self.server_sessions = {}
+        self.server_tasks = {}
+        self.server_capabilities = {}
+        self.server_connect_times = {}
         self.available_tools = []
         self.available_prompts = []
         self.available_resources = []
+        self.available_resource_templates = []
+
+        # Tools payload for the LLM, rebuilt only when the tools change
+        self.tools_version = 0
+        self.tools_payload_cache = {}
 
-    async def connect_to_servers(self, config_file):
+        # Cache for the results of the side-effect free tools, which are
+        # allowed by the `cacheTools` ({tool_name: ttl_seconds}) config of
+        # their server
+        self.tool_cache = TTLCache(max_size=256)
+        self.tool_cache_ttls = {}
+
+        # Cache for the resources of the servers which have `cacheResources`
+        # (ttl_seconds) in their config. The entries are (text, version),
+        # where the version comes from the resource listing of the server.
+        self.resource_cache = TTLCache(max_size=256)
+        self.resource_cache_ttls = {}
+        self.resource_versions = {}
+        self.resource_revalidations = 0
+
+        # Indexes for routing the calls to the servers
+        self.tool_index = {}
+        self.prompt_index = {}
+        self.resource_router = ResourceRouter()
+
+    async def connect_to_servers(
+        self, config_file, concurrent=False, ignore_errors=False
+    ):
+        """
+        Connect to all the servers defined in the config file.
+
+        Args:
+            config_file: Path to the JSON file containing `mcpServers`
+            concurrent: Start all the servers and run their discovery calls
+                in parallel instead of one server at a time
+            ignore_errors: Log and skip the servers which fail to connect,
+                instead of aborting the startup
+        """
         try:
             with open(config_file, "r", encoding="utf-8") as file:
                 data = json.load(file)
             servers = data.get("mcpServers", {})
-            for server_name, server_config in servers.items():
-                logger.info("Connecting to server: %s", server_name)
-                await self.connect_to_server(server_name, server_config)
         except Exception as err:
             logger.error("Error loading server config: %s", err)
             raise
 
+        if concurrent:
+            await self._connect_to_servers_concurrently(servers, ignore_errors)
+            return
+
+        for server_name, server_config in servers.items():
+            logger.info("Connecting to server: %s", server_name)
+            try:
+                await self.connect_to_server(server_name, server_config)
+            except Exception:
+                if not ignore_errors:
+                    raise
+
+    async def _connect_to_servers_concurrently(self, servers, ignore_errors):
+        # Every server session runs in its own task (see _open_session), so
+        # the servers can be started and discovered all at once.
+        for server_name in servers:
+            logger.info("Connecting to server: %s", server_name)
+        results = await asyncio.gather(
+            *(
+                self.connect_to_server(server_name, server_config)
+                for server_name, server_config in servers.items()
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            # Errors are already logged by connect_to_server
+            if isinstance(result, Exception) and not ignore_errors:
+                raise result
+
     async def connect_to_server(self, server_name, server_config):
-        # Check for duplicate server names
+        self._check_duplicate_server(server_name)
+
+        # Client side settings, which are not passed to the server
+        server_config = dict(server_config)
+        cache_tools = server_config.pop("cacheTools", {})
+        cache_resources = server_config.pop("cacheResources", None)
+
+        started = time.perf_counter()
+        try:
+            opened = await self._open_session(server_name, server_config)
+            await self._initialize_session(server_name, opened, started)
+            for tool_name, ttl in cache_tools.items():
+                tool_info = self.tool_index.get(tool_name)
+                if tool_info and tool_info["server_name"] == server_name:
+                    self.tool_cache_ttls[tool_name] = ttl
+            if cache_resources:
+                self.resource_cache_ttls[server_name] = cache_resources
+                await self.warm_up_resources(server_name)
+        except Exception as err:
+            logger.error(
+                "Error connecting to server '%s': %s", server_name, err
+            )
+            raise
+
+    def _check_duplicate_server(self, server_name):
+        """Raise an error if a server with the same name already exists."""
         if server_name in self.server_sessions:
             raise ValueError(
                 f"Duplicate server name '{server_name}' found."
                 " Each server must have a unique name."
             )
 
-        server_params = StdioServerParameters(**server_config)
+    async def _open_session(self, server_name, server_config):
+        """
+        Spawn the server process and open a client session to it.
+
+        The cancel scopes inside stdio_client and ClientSession must be exited
+        by the same task, in the reverse order they were entered. So each
+        session is kept open by its own task until it is stopped, either by
+        disconnect_server or by the shared exit stack on cleanup. This lets a
+        single server be disconnected without affecting the others.
+        """
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+        task = asyncio.create_task(
+            self._run_session(server_name, server_config, ready, stop)
+        )
+        self.exit_stack.push_async_callback(self._stop_session, task, stop)
+
+        session = await ready
+        return session, (task, stop)
+
+    async def _run_session(self, server_name, server_config, ready, stop):
+        """Keep a session open until the stop event is set."""
         try:
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
+            server_params = StdioServerParameters(**server_config)
+            async with stdio_client(server_params) as (read, write):
+                async with ClientSession(
+                    read,
+                    write,
+                    message_handler=partial(
+                        self._handle_server_message, server_name
+                    ),
+                ) as session:
+                    ready.set_result(session)
+                    await stop.wait()
+        except Exception as err:
+            if not ready.done():
+                ready.set_exception(err)
+            else:
+                logger.error("Server session closed with error: %s", err)
+        finally:
+            if not ready.done():
+                ready.cancel()
+
+    async def _stop_session(self, task, stop):
+        stop.set()
+        await task
+
+    async def _handle_server_message(self, server_name, message):
+        """Invalidate the cached resources when a server reports changes."""
+        if not isinstance(message, types.ServerNotification):
+            return
+
+        notification = message.root
+        if isinstance(notification, types.ResourceUpdatedNotification):
+            logger.info("Resource updated: %s", notification.params.uri)
+            self.resource_cache.delete(str(notification.params.uri))
+        elif isinstance(notification, types.ResourceListChangedNotification):
+            logger.info("Resource list changed: %s", server_name)
+            self.resource_cache.invalidate(
+                lambda uri: self.resource_router.route(uri) == server_name
             )
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(read, write)
+
+    async def _initialize_session(self, server_name, opened, started):
+        """Initialize the session and read the server's primitives."""
+        session, session_task = opened
+        init_result = await session.initialize()
+
+        # The discovery calls are independent, so send them all at once
+        (
+            tools_response,
+            prompts_response,
+            resources_response,
+            templates_response,
+        ) = await asyncio.gather(
+            session.list_tools(),
+            session.list_prompts(),
+            session.list_resources(),
+            session.list_resource_templates(),
+        )
+
+        # Store session in the dictionary
+        self.server_sessions[server_name] = session
+        self.server_tasks[server_name] = session_task
+        self.server_capabilities[server_name] = init_result.capabilities
+
+        # Read available tools
+        for tool in tools_response.tools:
+            self.available_tools.append(
+                {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "input_schema": tool.inputSchema,
+                    "server_name": server_name,
+                }
             )
-            await session.initialize()
 
-            # Store session in the dictionary
-            self.server_sessions[server_name] = session
+        # Read available prompts
+        if prompts_response and prompts_response.prompts:
+            for prompt in prompts_response.prompts:
+                self.available_prompts.append(
+                    {
+                        "name": prompt.name,
+                        "description": prompt.description,
+                        "arguments": prompt.arguments,
+                        "server_name": server_name,
+                    }
+                )
+
+        # Read available resources
+        if resources_response and resources_response.resources:
+            for resource in resources_response.resources:
+                uri = str(resource.uri)
+                self.resource_versions[uri] = self._resource_version(resource)
+                self.available_resources.append(
+                    {
+                        "name": resource.name,
+                        "uri": uri,
+                        "description": resource.description,
+                        "protocol": uri.split("://", maxsplit=1)[0] + "://",
+                        "server_name": server_name,
+                    }
+                )
 
-            # Read available tools
-            response = await session.list_tools()
-            for tool in response.tools:
-                self.available_tools.append(
+        # Read available resource templates
+        if templates_response and templates_response.resourceTemplates:
+            for template in templates_response.resourceTemplates:
+                self.available_resource_templates.append(
                     {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "input_schema": tool.inputSchema,
+                        "name": template.name,
+                        "uri_template": template.uriTemplate,
+                        "description": template.description,
                         "server_name": server_name,
                     }
                 )
 
-            # Read available prompts
-            prompts_response = await session.list_prompts()
-            if prompts_response and prompts_response.prompts:
-                for prompt in prompts_response.prompts:
-                    self.available_prompts.append(
-                        {
-                            "name": prompt.name,
-                            "description": prompt.description,
-                            "arguments": prompt.arguments,
-                            "server_name": server_name,
-                        }
-                    )
-            # Read available resources
-            resources_response = await session.list_resources()
-            if resources_response and resources_response.resources:
-                for resource in resources_response.resources:
-                    self.available_resources.append(
-                        {
-                            "name": resource.name,
-                            "uri": str(resource.uri),
-                            "description": resource.description,
-                            "protocol": str(resource.uri).split(
-                                "://", maxsplit=1
-                            )[0]
-                            + "://",
-                            "server_name": server_name,
-                        }
-                    )
+        self._index_server(server_name)
+        self._tools_changed()
 
-        except Exception as err:
-            logger.error(
-                "Error connecting to server '%s': %s", server_name, err
-            )
-            raise
+        self.server_connect_times[server_name] = time.perf_counter() - started
+        logger.info(
+            "Connected to server '%s' in %.2fs",
+            server_name,
+            self.server_connect_times[server_name],
+        )
+
+    async def disconnect_server(self, server_name):
+        """Close the session of a server and remove its primitives."""
+        self._get_session(server_name)
+        session_task = self.server_tasks.pop(server_name)
+        del self.server_sessions[server_name]
+        self.server_connect_times.pop(server_name, None)
+        self.server_capabilities.pop(server_name, None)
+        self.resource_cache_ttls.pop(server_name, None)
+        self.resource_cache.invalidate(
+            lambda uri: self.resource_router.route(uri) == server_name
+        )
+
+        server_tools = {
+            t["name"]
+            for t in self.available_tools
+            if t["server_name"] == server_name
+        }
+        for tool_name in server_tools:
+            self.tool_cache_ttls.pop(tool_name, None)
+        self.tool_cache.invalidate(lambda key: key[0] in server_tools)
+
+        self.available_tools = [
+            t for t in self.available_tools if t["server_name"] != server_name
+        ]
+        self.available_prompts = [
+            p
+            for p in self.available_prompts
+            if p["server_name"] != server_name
+        ]
+        self.available_resources = [
+            r
+            for r in self.available_resources
+            if r["server_name"] != server_name
+        ]
+        self.available_resource_templates = [
+            t
+            for t in self.available_resource_templates
+            if t["server_name"] != server_name
+        ]
+        self._rebuild_indexes()
+        self._tools_changed()
+
+        await self._stop_session(*session_task)
+        logger.info("Disconnected from server: %s", server_name)
+
+    def _index_server(self, server_name):
+        """
+        Add the primitives of a server to the routing indexes. When more than
+        one server provides the same name, the first connected one is used.
+        """
+        for tool in self.available_tools:
+            if tool["server_name"] == server_name:
+                self.tool_index.setdefault(tool["name"], tool)
+        for prompt in self.available_prompts:
+            if prompt["server_name"] == server_name:
+                self.prompt_index.setdefault(prompt["name"], prompt)
+        for resource in self.available_resources:
+            if resource["server_name"] == server_name:
+                self.resource_router.add_uri(resource["uri"], server_name)
+                self.resource_router.add_prefix(
+                    resource["protocol"], server_name
+                )
+        for template in self.available_resource_templates:
+            if template["server_name"] == server_name:
+                self.resource_router.add_template(
+                    template["uri_template"], server_name
+                )
+
+    def _rebuild_indexes(self):
+        """Rebuild the routing indexes from the connected servers."""
+        self.tool_index.clear()
+        self.prompt_index.clear()
+        self.resource_router.clear()
+        for server_name in self.server_sessions:
+            self._index_server(server_name)
+
+    def _tools_changed(self):
+        """Bump the tools version, so the cached tools payload is rebuilt."""
+        self.tools_version += 1
+        self.tools_payload_cache.clear()
+
+    def get_tools_payload(self, cache_control=False):
+        """
+        Get the available tools in the format expected by the Anthropic API
+        (without any additional or non-serializable data). The payload is
+        built once per tools version and shared, so it must not be modified.
+
+        Args:
+            cache_control: Mark the end of the tools block as a prompt caching
+                breakpoint, so the provider can reuse the tool definitions
+                across turns instead of processing them again.
+        """
+        key = (self.tools_version, cache_control)
+        payload = self.tools_payload_cache.get(key)
+        if payload is None:
+            payload = [
+                {
+                    "name": tool["name"],
+                    "description": tool["description"],
+                    "input_schema": tool["input_schema"],
+                }
+                for tool in self.available_tools
+            ]
+            if cache_control and payload:
+                payload[-1]["cache_control"] = {"type": "ephemeral"}
+            self.tools_payload_cache[key] = payload
+        return payload
 
     def _get_session(self, server_name):
         """Get session for a server with error handling."""
@@ -111,15 +443,53 @@ class MCPClient:
 
     async def execute_tool(self, tool_name, arguments):
         """Execute a tool call and return the result."""
-        tool_info = next(
-            (t for t in self.available_tools if t["name"] == tool_name),
-            None,
-        )
+        tool_info = self.tool_index.get(tool_name)
         if not tool_info:
             raise ValueError(f"Tool '{tool_name}' not found.")
 
         session = self._get_session(tool_info["server_name"])
-        return await session.call_tool(tool_name, arguments=arguments)
+
+        ttl = self.tool_cache_ttls.get(tool_name)
+        if not ttl:
+            return await session.call_tool(tool_name, arguments=arguments)
+
+        cache_key = (tool_name, self._canonicalize_arguments(arguments))
+        result = self.tool_cache.get(cache_key)
+        if result is None:
+            result = await session.call_tool(tool_name, arguments=arguments)
+            if not result.isError:
+                self.tool_cache.set(cache_key, result, ttl)
+        return result
+
+    @staticmethod
+    def _canonicalize_arguments(arguments):
+        """
+        Get a canonical form of the tool arguments for the cache key, so the
+        order of the arguments and the unset ones do not matter.
+        """
+        return json.dumps(
+            {k: v for k, v in (arguments or {}).items() if v is not None},
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+
+    async def execute_tools(self, tool_calls):
+        """
+        Execute tool calls concurrently (across the server sessions) and
+        return their results in the same order. A failed call returns its
+        exception instead of a result.
+
+        Args:
+            tool_calls: List of (tool_name, arguments) tuples
+        """
+        return await asyncio.gather(
+            *(
+                self.execute_tool(tool_name, arguments)
+                for tool_name, arguments in tool_calls
+            ),
+            return_exceptions=True,
+        )
 
     async def get_resource(self, resource_uri):
         """Read a resource and display its content."""
@@ -127,36 +497,121 @@ class MCPClient:
             if "://" not in resource_uri:
                 raise ValueError(f"Invalid resource URI: {resource_uri}")
 
-            protocol = resource_uri.split("://")[0] + "://"
-            resource_info = next(
-                (
-                    r
-                    for r in self.available_resources
-                    if r["protocol"] == protocol
-                ),
-                None,
-            )
-            if not resource_info:
-                raise ValueError(f"Protocol '{protocol}' not found.")
+            server_name = self.resource_router.route(resource_uri)
+            if not server_name:
+                raise ValueError(f"No server found for '{resource_uri}'.")
 
-            session = self._get_session(resource_info["server_name"])
-            result = await session.read_resource(uri=resource_uri)
-
-            if result and result.contents:
-                logger.info("Resource: %s", resource_uri)
-                return result.contents[0].text
-            else:
-                return "No content available."
+            # Only the listed resources are cached. The URIs of resource
+            # templates have no version to revalidate them, and their
+            # content may change at any time (e.g. the orders of a customer).
+            if (
+                server_name in self.resource_cache_ttls
+                and resource_uri in self.resource_versions
+            ):
+                return await self._read_cached_resource(
+                    server_name, resource_uri
+                )
+            return await self._read_resource(server_name, resource_uri)
         except Exception as err:
             logger.error("Error reading resource '%s': %s", resource_uri, err)
             raise
 
+    async def _read_resource(self, server_name, resource_uri):
+        session = self._get_session(server_name)
+        result = await session.read_resource(uri=resource_uri)
+
+        if result and result.contents:
+            logger.info("Resource: %s", resource_uri)
+            return result.contents[0].text
+        else:
+            return "No content available."
+
+    async def _read_cached_resource(self, server_name, resource_uri):
+        """
+        Read a resource from the cache. An expired entry with a version is
+        revalidated against the server's resource listing first, and is only
+        read again if its version has changed.
+        """
+        entry = self.resource_cache.peek(resource_uri)
+        if entry and entry[0] < time.monotonic() and entry[1][1] is not None:
+            await self.revalidate_resources(server_name)
+
+        cached = self.resource_cache.get(resource_uri)
+        if cached is not None:
+            return cached[0]
+
+        version = self.resource_versions.get(resource_uri)
+        text = await self._read_resource(server_name, resource_uri)
+        self.resource_cache.set(
+            resource_uri,
+            (text, version),
+            self.resource_cache_ttls[server_name],
+        )
+        return text
+
+    async def revalidate_resources(self, server_name):
+        """
+        Revalidate all the cached resources of a server with a single
+        resource listing. The entries whose version has not changed are kept
+        for another TTL, and the others are removed.
+        """
+        session = self._get_session(server_name)
+        ttl = self.resource_cache_ttls[server_name]
+        response = await session.list_resources()
+        for resource in response.resources:
+            uri = str(resource.uri)
+            version = self._resource_version(resource)
+            self.resource_versions[uri] = version
+
+            entry = self.resource_cache.peek(uri)
+            if entry is None:
+                continue
+            text, cached_version = entry[1]
+            if version is not None and version == cached_version:
+                self.resource_cache.set(uri, (text, version), ttl)
+                self.resource_revalidations += 1
+            else:
+                self.resource_cache.delete(uri)
+
+    async def warm_up_resources(self, server_name):
+        """
+        Read all the static resources of a server into the cache, and
+        subscribe to their updates if the server supports it.
+        """
+        uris = [
+            r["uri"]
+            for r in self.available_resources
+            if r["server_name"] == server_name
+        ]
+        results = await asyncio.gather(
+            *(self._read_cached_resource(server_name, uri) for uri in uris),
+            return_exceptions=True,
+        )
+        for uri, result in zip(uris, results):
+            if isinstance(result, Exception):
+                logger.warning("Error warming up '%s': %s", uri, result)
+
+        capabilities = self.server_capabilities[server_name]
+        if capabilities.resources and capabilities.resources.subscribe:
+            session = self._get_session(server_name)
+            await asyncio.gather(
+                *(session.subscribe_resource(uri) for uri in uris)
+            )
+
+    @staticmethod
+    def _resource_version(resource):
+        """
+        Get the version of a listed resource from its `version` metadata or
+        its last modified annotation, or None if the server provides neither.
+        """
+        version = (getattr(resource, "meta", None) or {}).get("version")
+        if version is None and getattr(resource, "annotations", None):
+            version = getattr(resource.annotations, "lastModified", None)
+        return version
+
     async def get_prompt(self, prompt_name, args):
         """Get a prompt with the given arguments and return its content."""
-        prompt_info = next(
-            (p for p in self.available_prompts if p["name"] == prompt_name),
-            None,
-        )
+        prompt_info = self.prompt_index.get(prompt_name)
         if not prompt_info:
             logger.warning("Prompt '%s' not found.", prompt_name)
             return
@@ -0,0 +1,390 @@
+import os
+import json
+import time
+import bisect
+import asyncio
+import secrets
+import threading
+from utils import setup_logger
+
+logger = setup_logger(__name__, level="INFO")
+
+# Fields which every order must have, to be indexed
+REQUIRED_FIELDS = ("order_id", "customer_name", "order_datetime")
+
+# Crockford's base32 alphabet, which sorts in the same order as the values
+ID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+class OrderIdGenerator:
+    """
+    Generate unique order ids which sort by creation time (like ULIDs). An id
+    is a 48 bit millisecond timestamp followed by 80 random bits, encoded in
+    26 base32 characters. Within the same millisecond, the random part is
+    incremented, so the ids are strictly increasing.
+    """
+
+    def __init__(self, prefix: str = "ORD-"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.last_random = 0
+
+    def new_id(self) -> str:
+        with self.lock:
+            ms = time.time_ns() // 1_000_000
+            if ms <= self.last_ms:
+                # Same millisecond (or the clock went back)
+                ms = self.last_ms
+                random_bits = self.last_random + 1
+            else:
+                random_bits = secrets.randbits(80)
+            self.last_ms = ms
+            self.last_random = random_bits
+
+        value = (ms << 80) | random_bits
+        chars = []
+        for _ in range(26):
+            chars.append(ID_ALPHABET[value & 31])
+            value >>= 5
+        return self.prefix + "".join(reversed(chars))
+
+
+class OrderLog:
+    """
+    An append-only log of orders (one JSON line per order), which is the
+    durable store of the order server.
+
+    Orders are persisted with group commit: the orders placed while a write
+    is in progress are written and fsynced together in the next one (up to
+    `batch_size` orders per fsync), and each order is confirmed only after
+    its batch is on disk. The fsync runs in a thread, so the server keeps
+    accepting orders meanwhile.
+
+    Orders may carry an idempotency key. An order with a key which was seen
+    before (even while it is still being written) is not placed again, and
+    the original order is returned instead. A batch of orders is written
+    as a single line, so it is persisted all or nothing. An order is updated
+    by appending it again, and its last record replaces the earlier ones.
+
+    The log is replayed at startup to rebuild the orders, which are indexed
+    by order id, customer name and datetime for the order lookups.
+    """
+
+    def __init__(
+        self, path: str, batch_size: int = 256, max_delay: float = 0.0
+    ):
+        """
+        Args:
+            path: Path to the log file
+            batch_size: Maximum number of log records (orders or batches of
+                orders) written with one fsync
+            max_delay: Seconds to wait for more orders before writing a
+                batch which is not full (0 to write as soon as possible)
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        # Indexes of the orders by order id, customer name (lowercase) and
+        # datetime. The order ids sort by time, so the orders of a customer
+        # are in order.
+        self.orders = {}
+        self.by_customer = {}
+        self.by_datetime = []
+        self.idempotency_keys = {}
+        # Orders waiting to be written, as (orders, line, futures) entries
+        # with the futures of the callers of each order
+        self.pending = []
+        self.pending_keys = {}
+        # Keys claimed by callers which are placing their order (see
+        # claim_key), and are pending until it is appended or released
+        self.claimed_keys = set()
+        self.has_pending = None
+        self.file = None
+        self.writer_task = None
+        self.closing = False
+        self.commits = 0
+
+    async def open(self):
+        """Replay the log and start the writer task."""
+        self._replay()
+        # Unbuffered, so a failed write leaves no bytes behind to be flushed
+        self.file = open(self.path, "ab", buffering=0)
+        self.has_pending = asyncio.Event()
+        self.writer_task = asyncio.create_task(self._write_batches())
+        logger.info(
+            "Opened order log %s with %d orders", self.path, len(self.orders)
+        )
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A partial line from an interrupted write is skipped
+                    logger.warning("Skipped a corrupt line in the order log")
+                    continue
+                # A line is either an order or a batch of orders
+                for order in record.get("orders", [record]):
+                    try:
+                        self._index(order)
+                    except (KeyError, AttributeError) as err:
+                        logger.warning(
+                            "Skipped an invalid order in the order log: %s",
+                            err,
+                        )
+
+    def _index(self, order):
+        order_id = order["order_id"]
+        customer = order["customer_name"].lower().strip()
+        # A later record of the same order (a status update) replaces it
+        known = order_id in self.orders
+        self.orders[order_id] = order
+        if order.get("idempotency_key"):
+            self.idempotency_keys[order["idempotency_key"]] = order
+        if known:
+            return
+        self.by_customer.setdefault(customer, []).append(order_id)
+        bisect.insort(self.by_datetime, (order["order_datetime"], order_id))
+
+    @staticmethod
+    def _check(order):
+        """Check that an order has the fields needed to index it."""
+        missing = [field for field in REQUIRED_FIELDS if not order.get(field)]
+        if missing:
+            raise ValueError(f"Order is missing {', '.join(missing)}.")
+
+    def get_order(self, order_id):
+        """Get an order by its id, or None if it is not found."""
+        return self.orders.get(order_id)
+
+    def list_orders(self, customer_name=None, since=None, until=None):
+        """
+        Lazily list the orders, newest first, using the indexes.
+
+        Args:
+            customer_name: Only the orders of this customer (case insensitive)
+            since: Only the orders placed at or after this datetime
+                ("YYYY-MM-DD HH:MM:SS", or a prefix such as "YYYY-MM-DD")
+            until: Only the orders placed before this datetime
+
+        Yields:
+            The matching orders
+        """
+        if customer_name is not None:
+            order_ids = self.by_customer.get(customer_name.lower().strip(), [])
+            for order_id in reversed(order_ids):
+                order = self.orders[order_id]
+                if (not since or order["order_datetime"] >= since) and (
+                    not until or order["order_datetime"] < until
+                ):
+                    yield order
+            return
+
+        start = bisect.bisect_left(self.by_datetime, (since,)) if since else 0
+        end = (
+            bisect.bisect_left(self.by_datetime, (until,))
+            if until
+            else len(self.by_datetime)
+        )
+        for index in range(end - 1, start - 1, -1):
+            yield self.orders[self.by_datetime[index][1]]
+
+    def find_by_key(self, idempotency_key):
+        """Get the order placed with an idempotency key, if any."""
+        return self.idempotency_keys.get(idempotency_key)
+
+    async def get_by_key(self, idempotency_key):
+        """
+        Get the order placed with an idempotency key, waiting for it to be
+        written if it is still pending. Returns None if there is none.
+        """
+        order = self.idempotency_keys.get(idempotency_key)
+        if order is None and idempotency_key in self.pending_keys:
+            order = await asyncio.shield(self.pending_keys[idempotency_key])
+        return order
+
+    def claim_key(self, idempotency_key) -> bool:
+        """
+        Claim an idempotency key before placing its order, so concurrent
+        calls with the same key wait for it (in get_by_key) instead of
+        placing it again. The claim ends when the order is appended, or is
+        released with release_key.
+
+        Returns:
+            False if the key was already used or claimed
+        """
+        if (
+            idempotency_key in self.idempotency_keys
+            or idempotency_key in self.pending_keys
+        ):
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self.pending_keys[idempotency_key] = future
+        self.claimed_keys.add(idempotency_key)
+        return True
+
+    def release_key(self, idempotency_key):
+        """
+        Release a claimed key whose order was not placed. The callers
+        waiting for it get None, and may place the order themselves.
+        """
+        if idempotency_key not in self.claimed_keys:
+            return
+        self.claimed_keys.discard(idempotency_key)
+        future = self.pending_keys.pop(idempotency_key)
+        if not future.done():
+            future.set_result(None)
+
+    async def append(self, order: dict) -> dict:
+        """
+        Durably append an order to the log.
+
+        Returns:
+            The order, or the order placed before with the same idempotency
+            key (in which case nothing is appended)
+        """
+        self._check(order)
+        key = order.get("idempotency_key")
+        if key and key not in self.claimed_keys:
+            existing = self.idempotency_keys.get(key)
+            if existing is not None:
+                return existing
+            in_flight = self.pending_keys.get(key)
+            if in_flight is not None:
+                return await asyncio.shield(in_flight)
+
+        (future,) = self._enqueue([order], order)
+        return await asyncio.shield(future)
+
+    async def append_batch(self, orders: list) -> list:
+        """
+        Durably append a batch of orders to the log, all or nothing. The
+        orders must not have idempotency keys which were seen before.
+
+        Returns:
+            The orders
+        """
+        for order in orders:
+            self._check(order)
+            key = order.get("idempotency_key")
+            if key and (
+                key in self.idempotency_keys
+                or (key in self.pending_keys and key not in self.claimed_keys)
+            ):
+                raise ValueError(f"Duplicate idempotency key: {key}")
+
+        futures = self._enqueue(orders, {"orders": orders})
+        return list(await asyncio.shield(asyncio.gather(*futures)))
+
+    async def update(self, order: dict) -> dict:
+        """
+        Durably append a new version of an order placed before (e.g. with a
+        new status), which replaces it.
+
+        Returns:
+            The order
+        """
+        self._check(order)
+        if order["order_id"] not in self.orders:
+            raise KeyError(f"Order {order['order_id']} not found.")
+        (future,) = self._enqueue([order], order)
+        return await asyncio.shield(future)
+
+    def _enqueue(self, orders, record):
+        """Add orders to be written as a log record, and get their futures."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for order in orders:
+            key = order.get("idempotency_key")
+            if key in self.claimed_keys:
+                # The order of a claimed key resolves the future of its claim
+                self.claimed_keys.discard(key)
+                futures.append(self.pending_keys[key])
+            else:
+                futures.append(loop.create_future())
+                if key:
+                    self.pending_keys[key] = futures[-1]
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        self.pending.append((orders, line, futures))
+        self.has_pending.set()
+        return futures
+
+    async def _write_batches(self):
+        while True:
+            await self.has_pending.wait()
+            if not self.pending:
+                # Woken up by close() with nothing left to write
+                break
+            if self.max_delay and len(self.pending) < self.batch_size:
+                await asyncio.sleep(self.max_delay)
+
+            batch = self.pending[: self.batch_size]
+            del self.pending[: self.batch_size]
+            if not self.pending and not self.closing:
+                self.has_pending.clear()
+
+            lines = b"".join(line for _, line, _ in batch)
+            try:
+                await asyncio.to_thread(self._write, lines)
+            except Exception as err:
+                logger.error("Failed to write to the order log: %s", err)
+                for orders, _, futures in batch:
+                    for order, future in zip(orders, futures):
+                        self.pending_keys.pop(
+                            order.get("idempotency_key"), None
+                        )
+                        if not future.done():
+                            future.set_exception(err)
+                continue
+
+            self.commits += 1
+            for orders, _, futures in batch:
+                for order, future in zip(orders, futures):
+                    self.pending_keys.pop(order.get("idempotency_key"), None)
+                    try:
+                        self._index(order)
+                    except Exception as err:
+                        # Only this order fails, and the writer keeps going
+                        logger.error(
+                            "Failed to index order %s: %s",
+                            order.get("order_id"),
+                            err,
+                        )
+                        if not future.done():
+                            future.set_exception(err)
+                        continue
+                    if not future.done():
+                        future.set_result(order)
+
+    def _write(self, data: bytes):
+        # The size of the file, rather than its position, which is past the
+        # end after an earlier write was cut off
+        offset = os.fstat(self.file.fileno()).st_size
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[self.file.write(view) :]
+            os.fsync(self.file.fileno())
+        except Exception:
+            # Cut off what was partially written, so the next batch does not
+            # start in the middle of an unterminated line (and get skipped
+            # with it at replay)
+            try:
+                os.ftruncate(self.file.fileno(), offset)
+            except OSError as err:
+                logger.error("Failed to truncate the order log: %s", err)
+            raise
+
+    async def close(self):
+        """Write the pending orders and close the log."""
+        if self.writer_task is None:
+            return
+        self.closing = True
+        self.has_pending.set()
+        await self.writer_task
+        self.writer_task = None
+        self.file.close()
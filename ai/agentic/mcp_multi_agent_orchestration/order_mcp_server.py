@@ -1,8 +1,87 @@
+import os
+import time
+import asyncio
+import itertools
+import contextlib
 from datetime import datetime
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
+from inventory_store import InventoryStore
+from order_log import OrderIdGenerator, OrderLog
+from order_processing import FINAL_STATUSES, OrderProcessor, StubOrderBackend
 
+# The orders are persisted in an append-only log, with group commit of up to
+# ORDER_LOG_BATCH_SIZE orders per fsync
+order_log = OrderLog(
+    os.environ.get("ORDER_LOG", "orders.log"),
+    batch_size=int(os.environ.get("ORDER_LOG_BATCH_SIZE", "256")),
+)
+order_ids = OrderIdGenerator()
 
-mcp = FastMCP("order")
+# The stock is reserved in the inventory shared with the product server
+inventory = InventoryStore(os.environ.get("PRODUCT_DB", "products.db"))
+
+# Fields of an order given to the bulk order tool
+ORDER_FIELDS = (
+    "product_id",
+    "size",
+    "color",
+    "customer_name",
+    "shipping_address",
+    "payment_method",
+)
+MAX_BULK_ORDERS = 100
+MAX_LISTED_ORDERS = 100
+MAX_STATUS_WAIT = 120
+
+
+async def settle_order(order: dict, status: str, error: str = None) -> dict:
+    """
+    Record the final status of a processed order, and return the stock of
+    a failed order to the inventory.
+    """
+    settled = dict(order, status=status)
+    if error:
+        settled["error"] = error
+    settled = await order_log.update(settled)
+    if status == "Failed":
+        inventory.cancel(order["order_id"])
+    return settled
+
+
+# With ORDER_PROCESSING=async, the orders are accepted as Pending and are
+# processed in the background by a pool of ORDER_WORKERS workers, against a
+# stub payment and fulfilment backend taking ORDER_BACKEND_LATENCY seconds
+# per call. Otherwise, they are confirmed at once.
+ASYNC_PROCESSING = os.environ.get("ORDER_PROCESSING", "sync") == "async"
+order_processor = OrderProcessor(
+    StubOrderBackend(
+        latency=float(os.environ.get("ORDER_BACKEND_LATENCY", "1.0")),
+        failure_rate=float(os.environ.get("ORDER_BACKEND_FAILURE_RATE", "0")),
+    ),
+    settle_order,
+    workers=int(os.environ.get("ORDER_WORKERS", "4")),
+)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(server):
+    # Reservations left over by a crash are returned to the stock
+    inventory.release_expired(max_age=300)
+    await order_log.open()
+    if ASYNC_PROCESSING:
+        await order_processor.start()
+        # Resume the orders which were not settled before a restart
+        for order in list(order_log.orders.values()):
+            if order["status"] not in FINAL_STATUSES:
+                order_processor.submit(order)
+    try:
+        yield
+    finally:
+        await order_processor.close()
+        await order_log.close()
+
+
+mcp = FastMCP("order", lifespan=lifespan)
 
 
 @mcp.resource("info://shipping")
@@ -27,43 +106,358 @@ def get_shipping_info() -> str:
 
 
 @mcp.tool()
-def place_order(
+async def place_order(
     product_id: str,
+    size: str,
+    color: str,
     quantity: int,
     customer_name: str,
     shipping_address: str,
     payment_method: str,
+    idempotency_key: str = None,
 ) -> dict:
     """
     Place an order for a product.
 
     Args:
         product_id: ID of the product to order
+        size: Size of the product
+        color: Color of the product
         quantity: Number of items to order
         customer_name: Name of the customer placing the order
         shipping_address: Address where the order should be shipped
         payment_method: Payment method used for the order
+        idempotency_key: Unique key of this order (e.g. a UUID). If the call
+            is retried with the same key, the original order is returned
+            instead of placing a new one.
 
     Returns:
-        A dictionary containing order confirmation details
+        A dictionary containing order confirmation details. If the orders are
+        processed in the background, the order is Pending, and its progress
+        can be followed with the order_status tool.
     """
     # Simulate order processing logic. This could be calling one or mutliple
     # external services, APIs, data stores, etc.
 
+    # A retried call returns the order which was already placed. Otherwise
+    # the key is claimed before reserving any stock, so a concurrent call
+    # with the same key waits for this one instead of placing it again.
+    while idempotency_key:
+        existing = await order_log.get_by_key(idempotency_key)
+        if existing is not None:
+            return existing
+        if order_log.claim_key(idempotency_key):
+            break
+
     # Get current datetime with seconds
     order_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+    # Reserve the stock first, which fails if there is not enough of it
+    order_id = order_ids.new_id()
+    try:
+        inventory.reserve(order_id, product_id, size, color, quantity)
+    except Exception:
+        order_log.release_key(idempotency_key)
+        raise
+
     order_confirmation = {
-        "order_id": f"ORD-{product_id}-{quantity}",
+        "order_id": order_id,
         "product_id": product_id,
+        "size": size,
+        "color": color,
         "quantity": quantity,
         "customer_name": customer_name,
         "shipping_address": shipping_address,
         "payment_method": payment_method,
         "order_datetime": order_datetime,
-        "status": "Confirmed",
+        "status": "Pending" if ASYNC_PROCESSING else "Confirmed",
     }
-    return order_confirmation
+    if idempotency_key:
+        order_confirmation["idempotency_key"] = idempotency_key
+
+    # The order is accepted once it is durably written to the order log.
+    # This is shielded, so the reservation is settled even if the call is
+    # cancelled meanwhile.
+    order = await asyncio.shield(persist_order(order_confirmation))
+    if ASYNC_PROCESSING and order["order_id"] == order_id:
+        order_processor.submit(order)
+    return order
+
+
+async def persist_order(order: dict) -> dict:
+    """
+    Write an order to the order log, and then commit its stock reservation,
+    or release it if the order could not be written (or an order with the
+    same idempotency key was placed first).
+    """
+    reservation_id = order["order_id"]
+    try:
+        order = await order_log.append(order)
+    except Exception:
+        inventory.release(reservation_id)
+        order_log.release_key(order.get("idempotency_key"))
+        raise
+    if order["order_id"] != reservation_id:
+        inventory.release(reservation_id)
+        return order
+    inventory.commit(reservation_id)
+    return order
+
+
+@mcp.tool()
+async def place_orders_bulk(orders: list[dict]) -> dict:
+    """
+    Place several orders at once, all or nothing: the orders are validated
+    first, and their stock is reserved and they are written in a single
+    transaction, so either all of them are placed or none is.
+
+    Args:
+        orders: List of orders (up to 100), each a dictionary with the
+            product_id, size, color, quantity, customer_name,
+            shipping_address, payment_method and an optional
+            idempotency_key (see place_order)
+
+    Returns:
+        A dictionary with the confirmation details of the orders, in the
+        same order. An order with an idempotency key which was seen before
+        is not placed again, and its original confirmation is returned.
+    """
+    if not orders:
+        raise ValueError("No orders given.")
+    if len(orders) > MAX_BULK_ORDERS:
+        raise ValueError(f"At most {MAX_BULK_ORDERS} orders can be placed.")
+
+    errors = []
+    keys = set()
+    for index, order in enumerate(orders):
+        missing = [
+            field
+            for field in ORDER_FIELDS
+            if not isinstance(order.get(field), (str, int))
+            or not str(order[field]).strip()
+        ]
+        if missing:
+            errors.append(f"order {index}: missing {', '.join(missing)}")
+        quantity = order.get("quantity")
+        if not isinstance(quantity, int) or quantity < 1:
+            errors.append(f"order {index}: quantity must be at least 1")
+        key = order.get("idempotency_key")
+        if key:
+            if key in keys:
+                errors.append(f"order {index}: duplicate idempotency_key")
+            keys.add(key)
+    if errors:
+        raise ValueError("Invalid orders: " + "; ".join(errors))
+
+    # Retried orders return the orders which were already placed, and the
+    # keys of the others are claimed before reserving any stock (as in
+    # place_order). The keys are claimed in sorted order, so two requests
+    # sharing several keys cannot wait for each other's claims.
+    confirmations = [None] * len(orders)
+    claimed = []
+    try:
+        for key, index in sorted(
+            (
+                (order["idempotency_key"], index)
+                for index, order in enumerate(orders)
+                if order.get("idempotency_key")
+            ),
+            key=lambda item: str(item[0]),
+        ):
+            while True:
+                existing = await order_log.get_by_key(key)
+                if existing is not None:
+                    confirmations[index] = existing
+                    break
+                if order_log.claim_key(key):
+                    claimed.append(key)
+                    break
+        new_orders = [
+            index
+            for index, confirmation in enumerate(confirmations)
+            if confirmation is None
+        ]
+
+        batch = []
+        if new_orders:
+            order_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            for index in new_orders:
+                order = orders[index]
+                confirmation = {
+                    "order_id": order_ids.new_id(),
+                    "product_id": str(order["product_id"]),
+                    "size": str(order["size"]),
+                    "color": order["color"],
+                    "quantity": order["quantity"],
+                    "customer_name": order["customer_name"],
+                    "shipping_address": order["shipping_address"],
+                    "payment_method": order["payment_method"],
+                    "order_datetime": order_datetime,
+                    "status": "Pending" if ASYNC_PROCESSING else "Confirmed",
+                }
+                if order.get("idempotency_key"):
+                    confirmation["idempotency_key"] = order["idempotency_key"]
+                batch.append(confirmation)
+
+            # Reserve the stock of all the orders, which fails if any of
+            # them has not enough of it
+            inventory.reserve_many(
+                [
+                    (
+                        order["order_id"],
+                        order["product_id"],
+                        order["size"],
+                        order["color"],
+                        order["quantity"],
+                    )
+                    for order in batch
+                ]
+            )
+    except BaseException:
+        for key in claimed:
+            order_log.release_key(key)
+        raise
+
+    if batch:
+        batch = await asyncio.shield(persist_orders(batch))
+        for index, order in zip(new_orders, batch):
+            confirmations[index] = order
+            if ASYNC_PROCESSING:
+                order_processor.submit(order)
+
+    return {"orders": confirmations, "count": len(confirmations)}
+
+
+async def persist_orders(orders: list) -> list:
+    """
+    Write a batch of orders to the order log as one record, and then commit
+    their stock reservations, or release them if it could not be written.
+    """
+    reservation_ids = [order["order_id"] for order in orders]
+    try:
+        orders = await order_log.append_batch(orders)
+    except Exception:
+        inventory.release_many(reservation_ids)
+        for order in orders:
+            order_log.release_key(order.get("idempotency_key"))
+        raise
+    inventory.commit_many(reservation_ids)
+    return orders
+
+
+@mcp.tool()
+def get_order(order_id: str) -> dict:
+    """
+    Get an order by its ID.
+
+    Args:
+        order_id: ID of the order
+
+    Returns:
+        A dictionary containing the order confirmation details
+    """
+    order = order_log.get_order(order_id)
+    if order is None:
+        raise ValueError(f"Order {order_id} not found.")
+    return order
+
+
+@mcp.tool()
+async def order_status(
+    order_id: str, ctx: Context, wait: bool = False, timeout: float = 30
+) -> dict:
+    """
+    Get the status of an order, and the progress of a Pending order which is
+    being processed.
+
+    Args:
+        order_id: ID of the order
+        wait: Wait until the order is settled (Confirmed or Failed), sending
+            progress notifications meanwhile
+        timeout: Maximum number of seconds to wait (up to 120, default 30)
+
+    Returns:
+        A dictionary containing the order details, with the progress of the
+        processing if the order is not settled yet
+    """
+    if order_log.get_order(order_id) is None:
+        raise ValueError(f"Order {order_id} not found.")
+
+    deadline = time.monotonic() + max(0, min(timeout, MAX_STATUS_WAIT))
+    while wait:
+        order = order_log.get_order(order_id)
+        progress = order_processor.get_progress(order_id)
+        if order["status"] in FINAL_STATUSES or progress is None:
+            break
+        await ctx.report_progress(
+            progress["completed"], progress["total"], progress["step"]
+        )
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not await order_processor.wait_for_change(
+            order_id, remaining
+        ):
+            break
+
+    order = order_log.get_order(order_id)
+    progress = order_processor.get_progress(order_id)
+    if order["status"] not in FINAL_STATUSES and progress is not None:
+        order = dict(order, progress=progress)
+    return order
+
+
+@mcp.tool()
+def list_orders(
+    customer_name: str = None,
+    since: str = None,
+    until: str = None,
+    limit: int = 20,
+) -> dict:
+    """
+    List the orders, newest first.
+
+    Args:
+        customer_name: Only list the orders of this customer (optional)
+        since: Only list the orders placed at or after this date or datetime,
+            as "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS" (optional)
+        until: Only list the orders placed before this date or datetime
+            (optional)
+        limit: Maximum number of orders to list (up to 100, default 20)
+
+    Returns:
+        A dictionary with the list of orders and their count
+    """
+    limit = max(1, min(limit, MAX_LISTED_ORDERS))
+    orders = list(
+        itertools.islice(
+            order_log.list_orders(customer_name, since, until), limit
+        )
+    )
+    return {"orders": orders, "count": len(orders)}
+
+
+@mcp.resource("orders://{customer}")
+def get_customer_orders(customer: str) -> str:
+    """
+    This resource provides the orders of a customer, newest first.
+
+    Args:
+        customer: Name of the customer
+    Returns:
+        A markdown formatted string containing the customer's orders.
+    """
+    orders = list(order_log.list_orders(customer_name=customer))
+    if not orders:
+        return f"# Orders of {customer}\n\nNo orders found.\n"
+
+    lines = [f"# Orders of {customer}\n"]
+    for order in orders:
+        lines.append(
+            f"- **{order['order_id']}** ({order['order_datetime']}):"
+            f" {order['quantity']} x product {order['product_id']}"
+            f" (size {order['size']}, {order['color']}),"
+            f" {order['status']}"
+        )
+    return "\n".join(lines) + "\n"
 
 
 @mcp.prompt()
@@ -90,6 +484,7 @@ ORDER PROCESS:
 2. Collect information systematically:
    - "What's your full name?"
    - "How many would you like to order?"
+   - "Which size and color would you like?"
    - "What's your shipping address? Please include street, city, state, and zip code."
    - "What payment method would you prefer to use?"
 
@@ -106,6 +501,10 @@ ORDER PROCESS:
 IMPORTANT NOTES:
 - Never place an order without ALL required information
 - Always confirm details before calling the place order tools
+- Pass a new unique idempotency_key when placing an order, and the same key if you retry the same order
+- Use the bulk order tool when a customer orders several products at once
+- Use the order lookup tools when customers ask about their orders
+- If an order is Pending, tell the customer it is being processed, and check its status with the order status tool
 - Be helpful if customers need to modify shipping or payment information
 - Provide any information about orders and shipping options when is appropriate
 """
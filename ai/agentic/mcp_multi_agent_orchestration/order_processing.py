@@ -0,0 +1,157 @@
+import asyncio
+import random
+from utils import setup_logger
+
+logger = setup_logger(__name__, level="INFO")
+
+# Statuses of an order which is settled, and will not change anymore
+FINAL_STATUSES = ("Confirmed", "Failed")
+
+
+class OrderProcessingError(Exception):
+    """An order which was rejected by a backend (e.g. a declined payment)."""
+
+
+class StubOrderBackend:
+    """
+    A local stand-in for the payment and fulfilment backends, which takes
+    `latency` seconds per call and fails a `failure_rate` fraction of them.
+
+    A real backend provides the same coroutines, calling the external
+    services (and raising OrderProcessingError when they reject an order).
+    """
+
+    def __init__(self, latency: float = 1.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    async def _call(self, action, order):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise OrderProcessingError(
+                f"The {action} of order {order['order_id']} was declined."
+            )
+
+    async def charge_payment(self, order: dict):
+        await self._call("payment", order)
+
+    async def create_shipment(self, order: dict):
+        await self._call("shipment", order)
+
+
+class OrderProcessor:
+    """
+    A pool of worker tasks which process the pending orders in the
+    background: each order is charged and shipped by the backend, and is
+    then settled as Confirmed, or Failed if a backend rejects it.
+
+    The workers run concurrently in the server's event loop, so many orders
+    are processed at once while the tool calls return immediately. The
+    progress of each order is kept until it is settled, and callers can wait
+    for its changes.
+    """
+
+    # The processing steps, with the backend coroutine of each
+    STEPS = (
+        ("payment", "charge_payment"),
+        ("shipment", "create_shipment"),
+    )
+
+    def __init__(self, backend, settle, workers: int = 4):
+        """
+        Args:
+            backend: The payment and fulfilment backend (see
+                StubOrderBackend)
+            settle: Coroutine function called with an order and its final
+                status (and the error message of a failed order)
+            workers: Number of orders processed concurrently
+        """
+        self.backend = backend
+        self.settle = settle
+        self.workers = workers
+        self.queue = None
+        self.tasks = []
+        # Progress of the orders being processed, and the events set when it
+        # changes
+        self.progress = {}
+        self.changed = {}
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.tasks = [
+            asyncio.create_task(self._work()) for _ in range(self.workers)
+        ]
+
+    def submit(self, order: dict):
+        """Queue an order to be processed."""
+        order_id = order["order_id"]
+        self.progress[order_id] = {
+            "step": "queued",
+            "completed": 0,
+            "total": len(self.STEPS) + 1,
+        }
+        self.changed[order_id] = asyncio.Event()
+        self.queue.put_nowait(order)
+
+    def get_progress(self, order_id):
+        """Get the progress of an order, or None if it is not processing."""
+        return self.progress.get(order_id)
+
+    async def wait_for_change(self, order_id, timeout: float = None):
+        """
+        Wait until the progress of an order changes (or it is settled).
+
+        Returns:
+            False if the timeout expired first, True otherwise
+        """
+        event = self.changed.get(order_id)
+        if event is None:
+            return True
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def _update(self, order_id, step, completed):
+        progress = self.progress[order_id]
+        progress["step"] = step
+        progress["completed"] = completed
+        # Wake up the waiters, and give the next ones a new event
+        self.changed[order_id].set()
+        self.changed[order_id] = asyncio.Event()
+
+    async def _work(self):
+        while True:
+            order = await self.queue.get()
+            try:
+                await self._process(order)
+            except Exception:
+                logger.exception("Failed to process %s", order["order_id"])
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, order):
+        order_id = order["order_id"]
+        status, error = "Confirmed", None
+        for completed, (step, method) in enumerate(self.STEPS):
+            self._update(order_id, step, completed)
+            try:
+                await getattr(self.backend, method)(order)
+            except OrderProcessingError as err:
+                status, error = "Failed", str(err)
+                break
+
+        self._update(order_id, "settling", len(self.STEPS))
+        try:
+            await self.settle(order, status, error)
+        finally:
+            self.progress.pop(order_id, None)
+            self.changed.pop(order_id).set()
+
+    async def close(self):
+        """Stop the workers. Unsettled orders are resumed at the next start."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from catalog_store import SQLiteCatalogStore
+from inventory_store import InventoryStore
+
+PRODUCT = {
+    "product_id": "P001",
+    "name": "Essence",
+    "description": "A stylish sneaker suitable for various occasions.",
+    "category": "Lifestyle",
+    "price": 100.00,
+}
+SIZE = "9"
+COLOR = "Black"
+
+
+async def place_order(session, index):
+    """Place an order for one item, and return True if it was confirmed."""
+    result = await session.call_tool(
+        "place_order",
+        {
+            "product_id": PRODUCT["product_id"],
+            "size": SIZE,
+            "color": COLOR,
+            "quantity": 1,
+            "customer_name": f"Customer {index}",
+            "shipping_address": "1 Main Street",
+            "payment_method": "Credit Card",
+            "idempotency_key": f"order-{index}",
+        },
+    )
+    return not result.isError
+
+
+async def run_stress_test(args, directory):
+    db_path = os.path.join(directory, "products.db")
+    store = SQLiteCatalogStore(db_path)
+    store.import_catalog(
+        [PRODUCT],
+        {
+            PRODUCT["product_id"]: [
+                {"color": COLOR, "size": SIZE, "quantity": args.stock}
+            ]
+        },
+    )
+    store.close()
+
+    async with contextlib.AsyncExitStack() as stack:
+        # Several order servers (processes) sharing the same inventory, as
+        # with several shoppers' chatbots
+        sessions = []
+        for index in range(args.servers):
+            env = dict(
+                os.environ,
+                PRODUCT_DB=db_path,
+                ORDER_LOG=os.path.join(directory, f"orders-{index}.log"),
+            )
+            server_params = StdioServerParameters(
+                command=sys.executable, args=["order_mcp_server.py"], env=env
+            )
+            read, write = await stack.enter_async_context(
+                stdio_client(server_params, errlog=open(os.devnull, "w"))
+            )
+            session = await stack.enter_async_context(
+                ClientSession(read, write)
+            )
+            await session.initialize()
+            sessions.append(session)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                place_order(sessions[index % len(sessions)], index)
+                for index in range(args.orders)
+            )
+        )
+        elapsed = time.perf_counter() - started
+
+    # Check the inventory and the order logs against the confirmed orders
+    confirmed = sum(results)
+    inventory = InventoryStore(db_path)
+    remaining = inventory.get_quantity(PRODUCT["product_id"], SIZE, COLOR)
+    statuses = dict(
+        inventory.conn.execute(
+            "SELECT status, COUNT(*) FROM reservations GROUP BY status"
+        ).fetchall()
+    )
+    inventory.close()
+    logged = 0
+    for index in range(args.servers):
+        with open(os.path.join(directory, f"orders-{index}.log")) as file:
+            logged += sum(1 for line in file if json.loads(line))
+
+    print(
+        f"{args.orders} orders from {args.servers} order servers against"
+        f" a stock of {args.stock} in {elapsed:.2f}s"
+    )
+    print(f"  confirmed: {confirmed}, rejected: {args.orders - confirmed}")
+    print(f"  remaining stock: {remaining}, reservations: {statuses}")
+    print(f"  orders in the logs: {logged}")
+
+    expected = min(args.orders, args.stock)
+    ok = (
+        confirmed == expected
+        and remaining == args.stock - confirmed
+        and statuses.get("committed", 0) == confirmed
+        and logged == confirmed
+    )
+    print("PASSED" if ok else "FAILED: the stock was oversold or lost")
+    return ok
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Stress test of concurrent orders against small stock"
+    )
+    parser.add_argument(
+        "--orders",
+        type=int,
+        default=200,
+        help="Number of concurrent orders (default: 200)",
+    )
+    parser.add_argument(
+        "--stock",
+        type=int,
+        default=25,
+        help="Quantity in stock of the ordered SKU (default: 25)",
+    )
+    parser.add_argument(
+        "--servers",
+        type=int,
+        default=4,
+        help="Number of order server processes (default: 4)",
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_arguments()
+    with tempfile.TemporaryDirectory() as directory:
+        ok = await run_stress_test(args, directory)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())